@@ -0,0 +1,557 @@
+"""
+Multi-worker mode.
+
+Runs several copies of main.py as separate uvicorn processes, each owning its own
+share of browsers (own registry file, own tab pool), and puts a thin dispatcher in
+front of them. The dispatcher keeps a lease table (tab_id / browser port -> worker)
+and forwards each request to the process that owns the tab; bodies are passed
+through as raw bytes so JSON/SSE encoding stays on the workers' cores.
+
+    python cluster.py --workers 4 --port 8000
+"""
+import os
+import sys
+import json
+import math
+import asyncio
+import argparse
+import subprocess
+from typing import Optional
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+CLIENT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Hop-by-hop headers must not be forwarded by a proxy
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "content-length", "host"}
+
+
+class Worker:
+    def __init__(self, index: int, host: str, port: int, max_browsers: int):
+        self.index = index
+        self.url = f"http://{host}:{port}"
+        self.port = port
+        self.max_browsers = max_browsers
+        self.process = None
+        self.inflight = 0
+        self.browsers = set()
+        self.tabs = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.process is not None and self.process.poll() is None,
+            "max_browsers": self.max_browsers,
+            "browsers": sorted(self.browsers),
+            "tabs": self.tabs,
+            "inflight": self.inflight
+        }
+
+
+class Cluster:
+    def __init__(self, workers: int = 2, total_browsers: int = 10, host: str = "localhost", base_port: int = 8100):
+        per_worker = math.ceil(total_browsers / workers)
+        self.workers = [Worker(i, host, base_port + i, per_worker) for i in range(workers)]
+        self.tab_owner = {}
+        self.port_owner = {}
+        self.job_owner = {}     # job, crawl and recording ids -> worker
+        self.launching = {}     # ports claimed by a /launch still in flight -> worker
+        self.client = None
+
+    # --- PROCESS MANAGEMENT ---
+
+    def start(self):
+        for worker in self.workers:
+            env = dict(os.environ)
+            env["CRAWLGRID_WORKER_ID"] = str(worker.index)
+            env["CRAWLGRID_REGISTRY"] = f"browser_registry_{worker.index}.json"
+            # Each worker loads and lists its own jobs and recordings only
+            env["CRAWLGRID_JOBS_DIR"] = f"{os.environ.get('CRAWLGRID_JOBS_DIR', 'jobs')}_{worker.index}"
+            env["CRAWLGRID_RECORDINGS_DIR"] = f"{os.environ.get('CRAWLGRID_RECORDINGS_DIR', 'recordings')}_{worker.index}"
+            # The cache's LRU index lives in the process: one directory and a share of the budget per worker
+            env["CRAWLGRID_CACHE_DIR"] = f"{os.environ.get('CRAWLGRID_CACHE_DIR', 'response_cache')}_{worker.index}"
+            env["CRAWLGRID_CACHE_MAX_MB"] = str(max(1, int(os.environ.get("CRAWLGRID_CACHE_MAX_MB", 2048)) // len(self.workers)))
+            env["CRAWLGRID_MAX_BROWSERS"] = str(worker.max_browsers)
+            worker.process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "localhost", "--port", str(worker.port)],
+                cwd=CLIENT_DIR, env=env
+            )
+            print(f"🧩 [Cluster] Worker {worker.index} started on {worker.url} (pid {worker.process.pid})")
+
+    async def wait_ready(self, timeout: float = 30.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+        for worker in self.workers:
+            while True:
+                try:
+                    await self.client.get(f"{worker.url}/status", timeout=1.0)
+                    break
+                except httpx.HTTPError:
+                    if asyncio.get_running_loop().time() > deadline:
+                        raise RuntimeError(f"Worker {worker.index} did not come up on {worker.url}")
+                    await asyncio.sleep(0.2)
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.process and worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process:
+                try:
+                    worker.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+    # --- LEASE TABLE ---
+
+    async def refresh_leases(self):
+        """Rebuilds tab/port ownership from the workers themselves; tabs and browsers that are gone drop out."""
+        async def pull(worker: Worker):
+            try:
+                tabs = (await self.client.get(f"{worker.url}/tabs", timeout=5.0)).json()
+                ports = (await self.client.get(f"{worker.url}/list-browsers", timeout=5.0)).json()
+            except (httpx.HTTPError, ValueError):
+                return worker, None, None
+            return worker, tabs, ports
+
+        tab_owner, port_owner = {}, {}
+        for worker, tabs, ports in await asyncio.gather(*(pull(w) for w in self.workers)):
+            if tabs is None:
+                # Unreachable right now: keep what we knew about it
+                tab_owner.update({t: w for t, w in self.tab_owner.items() if w is worker})
+                port_owner.update({p: w for p, w in self.port_owner.items() if w is worker})
+                continue
+            tab_owner.update({tid: worker for tid in tabs})
+            port_owner.update({port: worker for port in ports})
+            worker.tabs = len(tabs)
+            worker.browsers = set(ports) | {p for p, w in self.launching.items() if w is worker}
+        port_owner.update(self.launching)
+        self.tab_owner = tab_owner
+        self.port_owner = port_owner
+
+    async def owner_of_tab(self, tab_id: str) -> Optional[Worker]:
+        if tab_id not in self.tab_owner:
+            await self.refresh_leases()
+        return self.tab_owner.get(tab_id)
+
+    async def owner_of_job(self, job_id: Optional[str], recording_id: Optional[str]) -> Optional[Worker]:
+        """Owner from response headers seen so far, else asks the workers (e.g. after a dispatcher restart)."""
+        key = job_id or recording_id
+        if key in self.job_owner:
+            return self.job_owner[key]
+        probes = ["recording-status"] if recording_id else ["job-status", "crawl-status"]
+
+        async def owns(worker: Worker) -> bool:
+            for probe in probes:
+                try:
+                    resp = await self.client.get(f"{worker.url}/{probe}",
+                                                 params={"recording_id": recording_id} if recording_id else {"job_id": job_id},
+                                                 timeout=5.0)
+                except httpx.HTTPError:
+                    continue
+                if resp.status_code == 200:
+                    return True
+            return False
+
+        for worker, found in zip(self.workers, await asyncio.gather(*(owns(w) for w in self.workers))):
+            if found:
+                self.job_owner[key] = worker
+                return worker
+        return None
+
+    def owner_for_launch(self, port: Optional[int]) -> Optional[Worker]:
+        if port is not None and port in self.port_owner:
+            return self.port_owner[port]
+        free = [w for w in self.workers if len(w.browsers) < w.max_browsers]
+        return min(free, key=lambda w: len(w.browsers)) if free else None
+
+    def least_loaded(self) -> Worker:
+        """Fewest in-flight requests per tab; workers without tabs only as a last resort."""
+        return min(self.workers, key=lambda w: (w.tabs == 0, w.inflight / max(w.tabs, 1)))
+
+    # --- FORWARDING ---
+
+    async def forward(self, worker: Worker, request: Request, path: str, params=None) -> Response:
+        """Streams the worker's response back untouched (works for JSON, SSE and files)."""
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+        upstream = self.client.build_request(
+            request.method, f"{worker.url}/{path}",
+            params=params if params is not None else request.query_params,
+            headers=headers, content=await request.body(), timeout=None
+        )
+        worker.inflight += 1
+        try:
+            resp = await self.client.send(upstream, stream=True)
+        except httpx.HTTPError as e:
+            worker.inflight -= 1
+            raise HTTPException(status_code=502, detail=f"Worker {worker.index} unreachable: {e}")
+
+        tab_id = resp.headers.get("x-tab-id")
+        if tab_id:
+            self.tab_owner[tab_id] = worker
+        job_id = resp.headers.get("x-job-id") or resp.headers.get("x-recording-id")
+        if job_id:
+            self.job_owner[job_id] = worker
+
+        async def close():
+            worker.inflight -= 1
+            await resp.aclose()
+
+        return StreamingResponse(
+            resp.aiter_raw(),
+            status_code=resp.status_code,
+            headers={k: v for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS},
+            background=BackgroundTask(close)
+        )
+
+    async def fan_out(self, method: str, path: str, params=None, body=None, timeout: float = 60.0) -> dict:
+        async def call(worker: Worker):
+            try:
+                resp = await self.client.request(method, f"{worker.url}/{path}", params=params, json=body,
+                                                 timeout=timeout)
+                return worker.index, resp.json()
+            except (httpx.HTTPError, ValueError) as e:
+                return worker.index, {"status": "error", "message": str(e)}
+
+        return dict(await asyncio.gather(*(call(w) for w in self.workers)))
+
+    async def coordinator_heartbeat(self):
+        """Reports the whole node (every worker's tabs summed) to the grid coordinator."""
+        coordinator_url = os.environ["CRAWLGRID_COORDINATOR"].rstrip("/")
+        public_url = os.environ.get("CRAWLGRID_PUBLIC_URL", "http://localhost:8000")
+        interval = float(os.environ.get("CRAWLGRID_HEARTBEAT_INTERVAL", 5))
+        while True:
+            statuses = [s for s in (await self.fan_out("GET", "status")).values() if "pooled_tabs" in s]
+            try:
+                await self.client.post(f"{coordinator_url}/heartbeat", params={
+                    "url": public_url,
+                    "capacity": sum(s["pooled_tabs"] for s in statuses),
+                    "idle": sum(s["idle_tabs"] for s in statuses)
+                }, timeout=5.0)
+            except httpx.HTTPError as e:
+                print(f"⚠️ [Cluster] Heartbeat to {coordinator_url} failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def create_app(cluster: Cluster) -> FastAPI:
+    app = FastAPI()
+
+    @app.on_event("startup")
+    async def startup_event():
+        cluster.client = httpx.AsyncClient(limits=httpx.Limits(max_connections=None, max_keepalive_connections=200))
+        cluster.start()
+        await cluster.wait_ready()
+        if os.environ.get("CRAWLGRID_COORDINATOR"):
+            asyncio.create_task(cluster.coordinator_heartbeat())
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        cluster.stop()
+        await cluster.client.aclose()
+
+    @app.get('/launch')
+    async def launch_with_port(request: Request, port: int):
+        worker = cluster.owner_for_launch(port)
+        if worker is None:
+            raise HTTPException(status_code=429, detail="Browser limit reached on every worker.")
+        # Claim the port before the worker answers so a concurrent launch lands on the same worker
+        claimed = port not in cluster.port_owner
+        cluster.port_owner[port] = worker
+        cluster.launching[port] = worker
+        worker.browsers.add(port)
+        try:
+            response = await cluster.forward(worker, request, "launch")
+        finally:
+            cluster.launching.pop(port, None)
+        if claimed and response.status_code != 200:
+            cluster.port_owner.pop(port, None)
+            worker.browsers.discard(port)
+        return response
+
+    @app.get('/launch-tabs')
+    async def launch_tabs(total_tabs: Optional[int] = None, tab_per_browser: Optional[int] = None):
+        await cluster.refresh_leases()
+        workers = [w for w in cluster.workers if w.browsers]
+        if not workers:
+            raise HTTPException(status_code=500, detail={"status": "error", "message": "No active browsers."})
+
+        if total_tabs:
+            # Split proportionally to each worker's browser count
+            browsers = sum(len(w.browsers) for w in workers)
+            shares = [total_tabs * len(w.browsers) // browsers for w in workers]
+            for i in range(total_tabs - sum(shares)):
+                shares[i % len(shares)] += 1
+            calls = [(w, {"total_tabs": n}) for w, n in zip(workers, shares) if n]
+        else:
+            calls = [(w, {"tab_per_browser": tab_per_browser}) for w in workers]
+
+        results = await asyncio.gather(*(
+            cluster.client.get(f"{w.url}/launch-tabs", params=p, timeout=120.0) for w, p in calls
+        ))
+        await cluster.refresh_leases()
+        return {
+            "status": "success",
+            "workers": {w.index: r.json() for (w, _), r in zip(calls, results)},
+            "total_in_pool": sum(w.tabs for w in cluster.workers)
+        }
+
+    @app.post('/get-url')
+    async def get_url(request: Request):
+        return await cluster.forward(cluster.least_loaded(), request, "get-url")
+
+    @app.get('/list-browsers')
+    async def list_browsers():
+        results = await cluster.fan_out("GET", "list-browsers")
+        return sorted(p for ports in results.values() if isinstance(ports, list) for p in ports)
+
+    @app.get('/registry')
+    async def show_registry():
+        merged = {}
+        for registry in (await cluster.fan_out("GET", "registry")).values():
+            if isinstance(registry, dict) and "status" not in registry:
+                merged.update(registry)
+        return merged
+
+    @app.get('/tabs')
+    async def list_tabs():
+        merged = {}
+        for index, tabs in (await cluster.fan_out("GET", "tabs")).items():
+            if isinstance(tabs, dict) and "status" not in tabs:
+                merged.update({tid: {**data, "worker": index} for tid, data in tabs.items()})
+        return merged
+
+    @app.get('/jobs')
+    async def list_jobs():
+        merged = []
+        for index, jobs in (await cluster.fan_out("GET", "jobs")).items():
+            if isinstance(jobs, list):
+                merged.extend({**job, "worker": index} for job in jobs)
+        return merged
+
+    @app.get('/crawls')
+    async def list_crawls():
+        merged = {}
+        for index, crawls in (await cluster.fan_out("GET", "crawls")).items():
+            if isinstance(crawls, dict) and "status" not in crawls:
+                merged.update({jid: {**data, "worker": index} for jid, data in crawls.items()})
+        return merged
+
+    @app.get('/status')
+    async def get_node_status():
+        results = await cluster.fan_out("GET", "registry")
+        browsers = 0
+        total_tabs = 0
+        for registry in results.values():
+            if isinstance(registry, dict) and "status" not in registry:
+                browsers += len(registry)
+                total_tabs += sum(len(data.get("tabs", {})) for data in registry.values())
+        max_browsers = sum(w.max_browsers for w in cluster.workers)
+        return {
+            "browsers": f"{browsers}/{max_browsers}",
+            "total_tabs": total_tabs,
+            "available_slots": max_browsers - browsers,
+            "workers": len(cluster.workers)
+        }
+
+    # --- NODE-WIDE OPERATIONS (targets are in the body, so every worker gets the call) ---
+
+    @app.post('/tag-tabs')
+    async def tag_tabs(request: Request):
+        results = list((await cluster.fan_out("POST", "tag-tabs", body=await request.json())).values())
+        missing = [set(r.get("missing", [])) for r in results if "missing" in r]
+        return {
+            "status": "success",
+            "tagged": sum(r.get("tagged", 0) for r in results),
+            # Each worker only knows its own tabs: missing means missing everywhere
+            "missing": sorted(set.intersection(*missing)) if missing else []
+        }
+
+    @app.post('/broadcast-js')
+    async def broadcast_js(request: Request):
+        body = await request.json()
+        # Generous upper bound: each worker runs its tabs in parallel within the per-tab timeout
+        timeout = float(body.get("timeout", 10.0)) + 30.0
+        if not body.get("stream"):
+            results = (await cluster.fan_out("POST", "broadcast-js", body=body, timeout=timeout)).values()
+            collected = [r for result in results for r in result.get("results", [])]
+            return {
+                "status": "success",
+                "total": len(collected),
+                "succeeded": sum(1 for r in collected if r["status"] == "success"),
+                "results": collected
+            }
+
+        async def merged():
+            lines = asyncio.Queue()
+
+            async def pump(worker: Worker):
+                try:
+                    async with cluster.client.stream("POST", f"{worker.url}/broadcast-js", json=body,
+                                                     timeout=timeout) as resp:
+                        async for line in resp.aiter_lines():
+                            if line:
+                                await lines.put(line)
+                except httpx.HTTPError as e:
+                    await lines.put(json.dumps({"status": "error", "worker": worker.index, "message": str(e)}))
+                finally:
+                    await lines.put(None)
+
+            pumps = [asyncio.create_task(pump(w)) for w in cluster.workers]
+            remaining = len(pumps)
+            try:
+                while remaining:
+                    line = await lines.get()
+                    if line is None:
+                        remaining -= 1
+                        continue
+                    yield line.encode("utf-8") + b"\n"
+            finally:
+                for task in pumps:
+                    task.cancel()
+
+        return StreamingResponse(merged(), media_type="application/x-ndjson")
+
+    @app.post('/session-apply')
+    async def session_apply(request: Request):
+        results = list((await cluster.fan_out("POST", "session-apply", body=await request.json())).values())
+        ok = [r for r in results if r.get("status") == "success"]
+        if not ok:
+            raise HTTPException(status_code=404, detail=results[0].get("detail", results[0]))
+        return {
+            "status": "success",
+            "applied": sum(r["applied"] for r in ok),
+            "errors": [e for r in ok for e in r["errors"]]
+        }
+
+    async def replicate_session(name: str, source: Worker):
+        """Copies a snapshot to every other worker so /get-url?session= works wherever it lands."""
+        exported = (await cluster.client.get(f"{source.url}/session-export", params={"name": name})).json()
+        state = {"name": name, "cookies": exported["cookies"], "origins": exported["origins"],
+                 "ttl": exported["expires_in"]}
+        await asyncio.gather(*(
+            cluster.client.post(f"{w.url}/session-import", json=state) for w in cluster.workers if w is not source
+        ))
+
+    @app.post('/session-snapshot')
+    async def session_snapshot(request: Request, tab_id: str, name: str):
+        worker = await cluster.owner_of_tab(tab_id)
+        if worker is None:
+            raise HTTPException(status_code=404, detail={"status": "error", "message": f"Tab {tab_id} not found."})
+        resp = await cluster.client.post(f"{worker.url}/session-snapshot", params=request.query_params, timeout=60.0)
+        if resp.status_code == 200:
+            await replicate_session(name, worker)
+        return Response(resp.content, status_code=resp.status_code, media_type="application/json")
+
+    @app.post('/session-import')
+    async def session_import(request: Request):
+        results = await cluster.fan_out("POST", "session-import", body=await request.json())
+        return next(iter(results.values()))
+
+    @app.post('/session-delete')
+    async def session_delete(name: str):
+        results = list((await cluster.fan_out("POST", "session-delete", params={"name": name})).values())
+        if not any(r.get("status") == "success" for r in results):
+            raise HTTPException(status_code=404, detail=f"Session '{name}' not found.")
+        return {"status": "success", "message": f"Session '{name}' deleted."}
+
+    # --- NODE-WIDE CONFIGURATION (every worker must end up with the same setting) ---
+
+    async def broadcast_config(path: str, params) -> dict:
+        results = await cluster.fan_out("POST", path, params=params)
+        failed = {index: r for index, r in results.items() if r.get("status") != "success"}
+        if failed:
+            # Rejected everywhere is a bad request; rejected somewhere leaves the workers out of step
+            status_code = 400 if len(failed) == len(results) else 502
+            raise HTTPException(status_code=status_code, detail={"status": "error", "workers": failed})
+        return results
+
+    @app.post('/scheduler/domain-policy')
+    async def set_domain_policy(request: Request):
+        results = await broadcast_config("scheduler/domain-policy", request.query_params)
+        return {**results[0], "workers": len(results)}
+
+    @app.post('/scheduler/tenant-weight')
+    async def set_tenant_weight(request: Request):
+        results = await broadcast_config("scheduler/tenant-weight", request.query_params)
+        return {**results[0], "workers": len(results)}
+
+    @app.post('/cache-mode')
+    async def set_cache_mode(mode: str, max_mb: Optional[int] = None):
+        params = {"mode": mode}
+        if max_mb is not None:
+            # The budget is for the node; each worker has its own cache
+            params["max_mb"] = max(1, max_mb // len(cluster.workers))
+        results = (await broadcast_config("cache-mode", params)).values()
+        reports = [r["cache"] for r in results]
+        return {
+            "status": "success",
+            "cache": {
+                "mode": mode,
+                "entries": sum(c["entries"] for c in reports),
+                "bytes": sum(c["bytes"] for c in reports),
+                "max_bytes": sum(c["max_bytes"] for c in reports)
+            },
+            "tabs": sum(r["tabs"] for r in results),
+            "workers": len(reports)
+        }
+
+    @app.post('/cache-clear')
+    async def cache_clear():
+        results = await broadcast_config("cache-clear", None)
+        return {"status": "success", "message": f"Response cache cleared on {len(results)} workers."}
+
+    @app.get('/cluster')
+    async def cluster_status():
+        return {w.index: w.to_dict() for w in cluster.workers}
+
+    @app.get('/cluster/{path:path}')
+    async def cluster_fan_out(path: str, request: Request):
+        """Per-worker view of any GET endpoint, e.g. /cluster/health or /cluster/scheduler."""
+        return await cluster.fan_out("GET", path, params=request.query_params)
+
+    @app.api_route('/{path:path}', methods=["GET", "POST"])
+    async def route_by_owner(path: str, request: Request):
+        """Everything else goes to the worker owning the tab (or browser) named in the query."""
+        tab_id = request.query_params.get("tab_id")
+        port = request.query_params.get("port")
+        job_id = request.query_params.get("job_id") or request.query_params.get("recording_id")
+        if job_id:
+            worker = await cluster.owner_of_job(request.query_params.get("job_id"),
+                                                request.query_params.get("recording_id"))
+            if worker is None:
+                raise HTTPException(status_code=404, detail={"status": "error", "message": f"Job {job_id} not found."})
+        elif tab_id:
+            worker = await cluster.owner_of_tab(tab_id)
+            if worker is None:
+                raise HTTPException(status_code=404, detail={"status": "error", "message": f"Tab {tab_id} not found."})
+        elif port and port.isdigit():
+            if int(port) not in cluster.port_owner:
+                await cluster.refresh_leases()
+            worker = cluster.port_owner.get(int(port))
+            if worker is None:
+                raise HTTPException(status_code=404, detail={"status": "error", "message": f"Port {port} not found."})
+        else:
+            worker = cluster.least_loaded()
+
+        response = await cluster.forward(worker, request, path)
+        if path == "kill" and response.status_code == 200 and port and port.isdigit():
+            cluster.port_owner.pop(int(port), None)
+            worker.browsers.discard(int(port))
+        return response
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the node as several worker processes behind one dispatcher.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--max-browsers", type=int, default=10, help="Browser limit for the whole node")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--worker-base-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    cluster = Cluster(args.workers, args.max_browsers, base_port=args.worker_base_port)
+    uvicorn.run(create_app(cluster), host=args.host, port=args.port)
@@ -0,0 +1,291 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+import hashlib
+import tempfile
+from collections import deque
+from typing import Optional, List, Callable, Awaitable
+from urllib.parse import urlsplit, urlunsplit, urldefrag
+
+# Runs inside the tab: absolute, de-duplicated link targets, no HTML leaves the browser
+EXTRACT_LINKS_JS = """
+const seen = new Set();
+for (const a of document.querySelectorAll('a[href]')) {
+    const href = a.href;
+    if (href && (href.startsWith('http://') || href.startsWith('https://'))) seen.add(href);
+}
+return Array.from(seen);
+"""
+
+
+class BloomFilter:
+    """Fixed-size seen-set: memory depends on capacity and error rate, not on URLs added."""
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str) -> bool:
+        """Adds item; returns False if it was (probably) already present."""
+        added = False
+        for pos in self._positions(item):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(item))
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.bits)
+
+
+class Frontier:
+    """
+    FIFO of (url, depth) that keeps at most memory_limit entries in RAM and
+    spills the rest to a temp file, read back in order once RAM drains.
+    push() never touches the disk: overflow is buffered and written out in
+    batches by flush(); flush() and pop() do their file I/O in a thread.
+    """
+    def __init__(self, memory_limit: int = 100_000, spool_dir: Optional[str] = None, flush_batch: int = 10_000):
+        self.memory_limit = memory_limit
+        self.spool_dir = spool_dir
+        self.flush_batch = flush_batch
+        self.memory = deque()
+        self.overflow = []      # spilled entries not on disk yet; they come after everything that is
+        self.spool = None
+        self.read_pos = 0
+        self.spooled = 0
+        self._io_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.memory) + self.spooled + len(self.overflow)
+
+    def push(self, url: str, depth: int):
+        if not self.spooled and not self.overflow and len(self.memory) < self.memory_limit:
+            self.memory.append((url, depth))
+            return
+        # Once anything has spilled, everything after it must spill too (keeps FIFO order)
+        self.overflow.append((url, depth))
+
+    async def flush(self):
+        """Writes buffered overflow to disk once a batch has built up."""
+        if len(self.overflow) < self.flush_batch:
+            return
+        async with self._io_lock:
+            entries, self.overflow = self.overflow, []
+            if entries:
+                await asyncio.to_thread(self._write, entries)
+                self.spooled += len(entries)
+
+    async def pop(self) -> Optional[tuple]:
+        if not self.memory and len(self):
+            async with self._io_lock:
+                # Another worker may have refilled while we waited for the lock
+                if not self.memory and self.spooled:
+                    await asyncio.to_thread(self._refill)
+                if not self.memory and not self.spooled:
+                    # Disk drained: the unwritten overflow is next in line
+                    take = min(len(self.overflow), self.memory_limit)
+                    self.memory.extend(self.overflow[:take])
+                    del self.overflow[:take]
+        return self.memory.popleft() if self.memory else None
+
+    def _write(self, entries: list):
+        if self.spool is None:
+            self.spool = tempfile.TemporaryFile(mode="w+", encoding="utf-8", dir=self.spool_dir)
+        self.spool.seek(0, os.SEEK_END)
+        self.spool.writelines(f"{depth}\t{url}\n" for url, depth in entries)
+
+    def _refill(self):
+        self.spool.seek(self.read_pos)
+        while self.spooled and len(self.memory) < self.memory_limit:
+            line = self.spool.readline()
+            if not line:
+                break
+            depth, url = line.rstrip("\n").split("\t", 1)
+            self.memory.append((url, int(depth)))
+            self.spooled -= 1
+        self.read_pos = self.spool.tell()
+        if not self.spooled:
+            # Fully drained: start the file over instead of letting it grow forever
+            self.spool.seek(0)
+            self.spool.truncate()
+            self.read_pos = 0
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """Canonical form used for dedup: no fragment, lowercase scheme/host, default path."""
+    url, _ = urldefrag(url.strip())
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    netloc = parts.hostname.lower()
+    if parts.port and parts.port != {"http": 80, "https": 443}[parts.scheme]:
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit((parts.scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class CrawlScope:
+    def __init__(self, allowed_domains: List[str], include_subdomains: bool = True, max_depth: int = 2):
+        self.allowed_domains = [d.lower().lstrip(".") for d in allowed_domains]
+        self.include_subdomains = include_subdomains
+        self.max_depth = max_depth
+
+    def allows(self, url: str, depth: int) -> bool:
+        if depth > self.max_depth:
+            return False
+        host = urlsplit(url).hostname or ""
+        for domain in self.allowed_domains:
+            if host == domain or (self.include_subdomains and host.endswith("." + domain)):
+                return True
+        return False
+
+
+class CrawlJob:
+    """
+    Server-side recursive crawl. Pages are fetched through the node's tab pool,
+    links are extracted inside the tab, and only URLs travel back to Python.
+    fetch(url) must return {"status": ..., "links": [...]}.
+    """
+    def __init__(self, fetch: Callable[[str], Awaitable[dict]], seeds: List[str], scope: CrawlScope,
+                 max_pages: Optional[int] = None, concurrency: int = 10,
+                 seen_capacity: int = 10_000_000, seen_error_rate: float = 0.001):
+        self.id = uuid.uuid4().hex[:12]
+        self.fetch = fetch
+        self.scope = scope
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.seen = BloomFilter(seen_capacity, seen_error_rate)
+        self._seen_summary = None   # kept once the bit array is freed
+        self.frontier = Frontier()
+        self.state = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self.stats = {"pages": 0, "errors": 0, "discovered": 0, "enqueued": 0, "duplicates": 0, "out_of_scope": 0}
+        self.recent = deque(maxlen=50)
+        self._inflight = 0
+        self._work_ready = asyncio.Event()
+        self._stop = False
+
+        for seed in seeds:
+            self._offer(seed, 0)
+
+    def _offer(self, url: str, depth: int):
+        url = normalize_url(url)
+        if url is None:
+            return
+        if not self.scope.allows(url, depth):
+            self.stats["out_of_scope"] += 1
+            return
+        if self.seen is None or not self.seen.add(url):
+            self.stats["duplicates"] += 1
+            return
+        self.frontier.push(url, depth)
+        self.stats["enqueued"] += 1
+        self._work_ready.set()
+
+    def _budget_left(self) -> bool:
+        return self.max_pages is None or self.stats["pages"] + self.stats["errors"] + self._inflight < self.max_pages
+
+    async def run(self):
+        self.state = "running"
+        self.started_at = time.time()
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        finally:
+            self.frontier.close()
+            self.finished_at = time.time()
+            if self.state == "running":
+                self.state = "done"
+            # The seen-set can be hundreds of MB and nothing is offered after this point
+            self._seen_summary = self._describe_seen()
+            self.seen = None
+
+    async def _worker(self):
+        while not self._stop:
+            item = await self.frontier.pop() if self._budget_left() else None
+            if item is None:
+                # Done once nothing is queued and nobody can discover more
+                if self._inflight == 0:
+                    self._work_ready.set()
+                    return
+                self._work_ready.clear()
+                await self._work_ready.wait()
+                continue
+
+            url, depth = item
+            self._inflight += 1
+            try:
+                result = await self.fetch(url)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            finally:
+                self._inflight -= 1
+
+            if result.get("status") == "success":
+                self.stats["pages"] += 1
+                links = result.get("links", [])
+                self.stats["discovered"] += len(links)
+                if depth < self.scope.max_depth:
+                    for link in links:
+                        self._offer(link, depth + 1)
+                    await self.frontier.flush()
+            else:
+                self.stats["errors"] += 1
+            self.recent.append({"url": url, "depth": depth, "status": result.get("status"),
+                                "links": len(result.get("links", []))})
+            # Wake idle workers: either new links arrived or this was the last page in flight
+            self._work_ready.set()
+
+    def _describe_seen(self) -> dict:
+        return {
+            "urls": self.seen.count,
+            "capacity": self.seen.capacity,
+            "bytes": self.seen.size_bytes,
+            "error_rate": self.seen.error_rate,
+            # Past capacity the false-positive rate (new URLs dropped as duplicates) climbs fast
+            "saturated": self.seen.count > self.seen.capacity
+        }
+
+    def stop(self):
+        self._stop = True
+        self.state = "stopped"
+        self._work_ready.set()
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "stats": dict(self.stats),
+            "frontier": len(self.frontier),
+            "inflight": self._inflight,
+            "pages_per_second": round(self.stats["pages"] / elapsed, 2) if elapsed else 0.0,
+            "seen_set": self._seen_summary or self._describe_seen(),
+            "scope": {"domains": self.scope.allowed_domains, "max_depth": self.scope.max_depth,
+                      "max_pages": self.max_pages},
+            "recent": list(self.recent)
+        }
@@ -0,0 +1,153 @@
+import sys
+import time
+import heapq
+import asyncio
+import threading
+import traceback
+from collections import deque
+from typing import Optional
+
+# Navigation Timing fields turned into per-stage durations (ms)
+NAV_TIMING_JS = "return JSON.stringify(performance.getEntriesByType('navigation')[0] || null)"
+NAV_STAGES = {
+    "redirect": ("redirectStart", "redirectEnd"),
+    "dns": ("domainLookupStart", "domainLookupEnd"),
+    "connect": ("connectStart", "connectEnd"),
+    "tls": ("secureConnectionStart", "connectEnd"),
+    "ttfb": ("requestStart", "responseStart"),
+    "download": ("responseStart", "responseEnd"),
+    "dom_interactive": ("responseEnd", "domInteractive"),
+    "dom_content_loaded": ("domInteractive", "domContentLoadedEventEnd"),
+    "load": ("domContentLoadedEventEnd", "loadEventEnd"),
+}
+
+
+class LoopLagMonitor:
+    """
+    Detects event-loop stalls without a profiler.
+    A coroutine ticks every `interval`; a watchdog thread notices when the ticks stop
+    for longer than `threshold` and captures the loop thread's stack at that moment,
+    which is the code doing the blocking. The stall's full length is filled in once
+    the loop gets to tick again.
+    """
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, max_events: int = 100):
+        self.threshold = threshold
+        self.interval = interval
+        self.events = deque(maxlen=max_events)
+        self.stats = {"ticks": 0, "stalls": 0, "max_lag": 0.0, "total_lag": 0.0}
+        self._last_tick = time.monotonic()
+        self._loop_thread = None
+        self._current = None    # stall being observed, not finished yet
+        self._running = False
+
+    async def run(self):
+        self._loop_thread = threading.get_ident()
+        # Time spent before the loop started (startup) is not a stall
+        self._last_tick = time.monotonic()
+        self._running = True
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+        try:
+            while True:
+                before = time.monotonic()
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - before - self.interval)
+                self._last_tick = now
+                self.stats["ticks"] += 1
+                self.stats["total_lag"] += lag
+                self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+                current = self._current
+                if current is not None:
+                    current["lag_seconds"] = round(lag, 3)
+                    self._current = None
+        finally:
+            self._running = False
+
+    def _watch(self):
+        while self._running:
+            time.sleep(self.interval / 2)
+            stalled = time.monotonic() - self._last_tick
+            if stalled < self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            event = {
+                "at": time.time() - stalled,
+                "lag_seconds": None,    # set when the loop resumes
+                "detected_after": round(stalled, 3),
+                "stack": traceback.format_stack(frame)
+            }
+            self._current = event
+            self.events.append(event)
+            self.stats["stalls"] += 1
+
+    def report(self) -> dict:
+        ticks = self.stats["ticks"]
+        return {
+            "threshold_seconds": self.threshold,
+            "stalls": self.stats["stalls"],
+            "max_lag_seconds": round(self.stats["max_lag"], 3),
+            "avg_lag_ms": round(self.stats["total_lag"] / ticks * 1000, 3) if ticks else 0.0,
+            "stalled_now": self._current is not None,
+            "events": list(reversed(self.events))
+        }
+
+
+def navigation_stages(timing: Optional[dict]) -> dict:
+    """Per-stage durations (ms) from a PerformanceNavigationTiming entry; absent stages are skipped."""
+    if not timing:
+        return {}
+    stages = {}
+    for name, (start, end) in NAV_STAGES.items():
+        if timing.get(start) and timing.get(end):
+            stages[name] = round(timing[end] - timing[start], 1)
+    return stages
+
+
+class SlowNavigations:
+    """
+    The `capacity` slowest navigations seen in the last `max_age` seconds.
+    Cheap to feed: observe() counts every navigation and tells the caller whether it
+    would make the list, so browser timing is only collected for those that would.
+    """
+    def __init__(self, capacity: int = 50, max_age: float = 3600.0):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._heap = []     # (total_seconds, seq, record), fastest on top
+        self._seq = 0
+        self.seen = 0
+
+    def _expire(self):
+        cutoff = time.time() - self.max_age
+        if any(record["at"] < cutoff for _, _, record in self._heap):
+            self._heap = [item for item in self._heap if item[2]["at"] >= cutoff]
+            heapq.heapify(self._heap)
+
+    def observe(self, total: float) -> bool:
+        """Counts a navigation; True if it is slow enough to be added."""
+        self.seen += 1
+        return self.would_keep(total)
+
+    def would_keep(self, total: float) -> bool:
+        self._expire()
+        return len(self._heap) < self.capacity or total > self._heap[0][0]
+
+    def add(self, total: float, record: dict):
+        if not self.would_keep(total):
+            return
+        self._seq += 1
+        item = (total, self._seq, {"at": time.time(), "total_seconds": round(total, 3), **record})
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heapreplace(self._heap, item)
+
+    def report(self) -> dict:
+        self._expire()
+        return {
+            "navigations_seen": self.seen,
+            "capacity": self.capacity,
+            "max_age_seconds": self.max_age,
+            "slowest": [record for _, _, record in sorted(self._heap, reverse=True)]
+        }
@@ -0,0 +1,115 @@
+import json
+import uuid
+import asyncio
+from typing import List
+
+BINDING_NAME = "__crawlgridNotify"
+
+# Installed in the page: a MutationObserver re-evaluates the selectors (debounced) and
+# reports appear / change / disappear through a CDP binding, so nothing polls from Python.
+WATCH_JS = """
+(function (watchId, specs, debounceMs, maxSnippet, bindingName) {
+    window.__crawlgridWatches = window.__crawlgridWatches || {};
+    if (window.__crawlgridWatches[watchId]) return;
+    const state = specs.map(() => null);
+    const find = (spec) => {
+        if (spec.startsWith('xpath:')) {
+            const r = document.evaluate(spec.slice(6), document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            const out = [];
+            for (let i = 0; i < r.snapshotLength; i++) out.push(r.snapshotItem(i));
+            return out;
+        }
+        return Array.from(document.querySelectorAll(spec.startsWith('css:') ? spec.slice(4) : spec));
+    };
+    const html = (n) => n.outerHTML !== undefined ? n.outerHTML : (n.textContent || '');
+    const hash = (s) => { let h = 5381; for (let i = 0; i < s.length; i++) h = ((h << 5) + h + s.charCodeAt(i)) | 0; return h; };
+    const check = () => {
+        specs.forEach((spec, i) => {
+            let nodes;
+            try { nodes = find(spec); } catch (e) { return; }
+            const sig = nodes.length + ':' + hash(nodes.slice(0, 20).map(html).join('\\u0000'));
+            const prev = state[i];
+            if (prev === sig) return;
+            state[i] = sig;
+            const had = prev !== null && !prev.startsWith('0:');
+            let event;
+            if (nodes.length && !had) event = 'appear';
+            else if (!nodes.length && had) event = 'disappear';
+            else if (nodes.length) event = 'change';
+            else return;
+            window[bindingName](JSON.stringify({
+                watch_id: watchId, selector: spec, event: event, count: nodes.length,
+                snippet: nodes.length ? html(nodes[0]).slice(0, maxSnippet) : null, url: location.href
+            }));
+        });
+    };
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (timer === null) timer = setTimeout(() => { timer = null; check(); }, debounceMs);
+    });
+    const start = () => {
+        observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+        check();
+    };
+    if (document.documentElement) start(); else document.addEventListener('DOMContentLoaded', start);
+    window.__crawlgridWatches[watchId] = {
+        disconnect: () => { observer.disconnect(); delete window.__crawlgridWatches[watchId]; }
+    };
+})(%s, %s, %d, %d, %s);
+"""
+
+
+class DomWatcher:
+    """
+    All DOM watches of one tab. Events arrive on DrissionPage's event thread via
+    Runtime.bindingCalled and are handed to each watch's asyncio queue.
+    Watches survive navigation: the observer is also registered for new documents.
+    """
+    def __init__(self, tab_obj):
+        self.tab_obj = tab_obj
+        self.watches = {}       # watch_id -> (loop, queue)
+        self.script_ids = {}    # watch_id -> addScriptToEvaluateOnNewDocument identifier
+
+    def _on_binding(self, **event):
+        if event.get("name") != BINDING_NAME:
+            return
+        try:
+            payload = json.loads(event.get("payload", ""))
+        except json.JSONDecodeError:
+            return
+        target = self.watches.get(payload.get("watch_id"))
+        if target:
+            loop, queue = target
+            loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    def add(self, selectors: List[str], loop, queue: asyncio.Queue, debounce_ms: int = 100, max_snippet: int = 2000) -> str:
+        watch_id = uuid.uuid4().hex[:12]
+        if not self.watches:
+            self.tab_obj.driver.set_callback("Runtime.bindingCalled", self._on_binding)
+            self.tab_obj.run_cdp("Runtime.enable")
+            self.tab_obj.run_cdp("Runtime.addBinding", name=BINDING_NAME)
+        self.watches[watch_id] = (loop, queue)
+
+        script = WATCH_JS % (json.dumps(watch_id), json.dumps(selectors), debounce_ms, max_snippet, json.dumps(BINDING_NAME))
+        result = self.tab_obj.run_cdp("Page.addScriptToEvaluateOnNewDocument", source=script)
+        self.script_ids[watch_id] = result.get("identifier")
+        self.tab_obj.run_cdp("Runtime.evaluate", expression=script)
+        return watch_id
+
+    def remove(self, watch_id: str):
+        if self.watches.pop(watch_id, None) is None:
+            return
+        script_id = self.script_ids.pop(watch_id, None)
+        try:
+            self.tab_obj.run_cdp(
+                "Runtime.evaluate",
+                expression=f"window.__crawlgridWatches && window.__crawlgridWatches[{json.dumps(watch_id)}] "
+                           f"&& window.__crawlgridWatches[{json.dumps(watch_id)}].disconnect()"
+            )
+            if script_id:
+                self.tab_obj.run_cdp("Page.removeScriptToEvaluateOnNewDocument", identifier=script_id)
+            if not self.watches:
+                self.tab_obj.run_cdp("Runtime.removeBinding", name=BINDING_NAME)
+                self.tab_obj.driver.set_callback("Runtime.bindingCalled", None)
+        except Exception as e:
+            print(f"⚠️ [Watch] Cleanup of {watch_id} incomplete: {e}")
@@ -0,0 +1,128 @@
+import json
+import zlib
+from typing import Optional, AsyncIterator
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Optional accelerators: fall back to the stdlib when they are not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# Compressing tiny bodies costs more CPU than it saves on the wire
+MIN_COMPRESS_SIZE = 1024
+
+
+def dumps_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _accepted(header: str) -> dict:
+    """Parses an Accept/Accept-Encoding header into {token: q}."""
+    accepted = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token.strip().lower()] = q
+    return accepted
+
+
+def negotiate_media_type(request: Request) -> str:
+    accepted = _accepted(request.headers.get("accept", ""))
+    if msgpack is not None and any(accepted.get(t, 0) > 0 for t in MSGPACK_TYPES):
+        return "application/msgpack"
+    return "application/json"
+
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+    """zstd if the client takes it and we have it, then gzip, else none."""
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    if zstandard is not None and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        # Level 5: most of level 9's ratio on HTML at a fraction of the CPU
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    return body
+
+
+def encode_response(request: Request, payload, headers: Optional[dict] = None) -> Response:
+    """Serializes payload in the client's preferred format and compression."""
+    media_type = negotiate_media_type(request)
+    if media_type == "application/msgpack":
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = dumps_json(payload)
+
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    encoding = negotiate_encoding(request)
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every chunk, so SSE events are not held back."""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._obj = zlib.compressobj(5, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def encode_stream(request: Request, chunks: AsyncIterator, media_type: str) -> StreamingResponse:
+    """Wraps a text/bytes generator in a StreamingResponse, compressed if the client allows it."""
+    encoding = negotiate_encoding(request)
+
+    async def body():
+        compressor = StreamCompressor(encoding) if encoding else None
+        async for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            yield compressor.chunk(data) if compressor else data
+        if compressor:
+            yield compressor.finish()
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
@@ -0,0 +1,149 @@
+import time
+from collections import deque
+from typing import Optional
+# Python file imports
+from utils import process_tree_rss
+
+
+class TabHealth:
+    """Navigation count and rolling latency for a single tab."""
+    def __init__(self, port: str, window: int = 20):
+        self.port = port
+        self.navigations = 0
+        self.created_at = time.time()
+        self.latencies = deque(maxlen=window)
+        # Average of the first full window, used as the "fresh tab" reference
+        self.baseline = None
+
+    def record(self, seconds: float):
+        self.navigations += 1
+        self.latencies.append(seconds)
+        if self.baseline is None and len(self.latencies) == self.latencies.maxlen:
+            self.baseline = self.avg_latency
+
+    @property
+    def avg_latency(self) -> float:
+        if not self.latencies:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port,
+            "navigations": self.navigations,
+            "avg_latency": round(self.avg_latency, 3),
+            "baseline_latency": round(self.baseline, 3) if self.baseline else None,
+            "age_seconds": int(time.time() - self.created_at)
+        }
+
+
+class BrowserHealth:
+    """Navigation count and process-tree RSS for a single browser."""
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.navigations = 0
+        self.created_at = time.time()
+        self.rss = 0
+        self.rss_checked_at = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "process_id": self.pid,
+            "navigations": self.navigations,
+            "rss_mb": round(self.rss / (1024 * 1024), 1),
+            "age_seconds": int(time.time() - self.created_at)
+        }
+
+
+class HealthTracker:
+    """
+    Decides when a tab or browser has degraded enough to be replaced.
+    A tab is recycled after too many navigations or when its rolling latency
+    drifts well past its own baseline. A browser is recycled on total
+    navigations or when its process tree grows past the RSS limit.
+    """
+    def __init__(self,
+                 max_navs_per_tab: int = 200,
+                 max_navs_per_browser: int = 2000,
+                 max_browser_rss_mb: int = 1536,
+                 latency_window: int = 20,
+                 latency_degradation: float = 2.5,
+                 rss_check_interval: float = 10.0):
+        self.max_navs_per_tab = max_navs_per_tab
+        self.max_navs_per_browser = max_navs_per_browser
+        self.max_browser_rss_mb = max_browser_rss_mb
+        self.latency_window = latency_window
+        self.latency_degradation = latency_degradation
+        self.rss_check_interval = rss_check_interval
+        self.tabs = {}
+        self.browsers = {}
+        self.recycled = {"tabs": 0, "browsers": 0}
+
+    # --- REGISTRATION ---
+
+    def track_tab(self, tab_id: str, port: str):
+        self.tabs[tab_id] = TabHealth(port, self.latency_window)
+
+    def forget_tab(self, tab_id: str):
+        self.tabs.pop(tab_id, None)
+
+    def track_browser(self, port: str, pid: Optional[int]):
+        self.browsers[port] = BrowserHealth(pid)
+
+    def forget_browser(self, port: str):
+        self.browsers.pop(port, None)
+        for tid in [tid for tid, t in self.tabs.items() if t.port == port]:
+            del self.tabs[tid]
+
+    # --- MEASUREMENT ---
+
+    def record_navigation(self, port: str, tab_id: str, seconds: float):
+        if tab_id in self.tabs:
+            self.tabs[tab_id].record(seconds)
+        if port in self.browsers:
+            self.browsers[port].navigations += 1
+
+    def refresh_rss(self, port: str, force: bool = False) -> int:
+        """Re-read the browser's RSS, at most once per rss_check_interval."""
+        browser = self.browsers.get(port)
+        if not browser:
+            return 0
+        now = time.time()
+        if force or now - browser.rss_checked_at >= self.rss_check_interval:
+            browser.rss = process_tree_rss(browser.pid)
+            browser.rss_checked_at = now
+        return browser.rss
+
+    # --- DECISIONS ---
+
+    def tab_needs_recycle(self, tab_id: str) -> bool:
+        tab = self.tabs.get(tab_id)
+        if not tab:
+            return False
+        if tab.navigations >= self.max_navs_per_tab:
+            return True
+        if tab.baseline and len(tab.latencies) == tab.latencies.maxlen:
+            return tab.avg_latency > tab.baseline * self.latency_degradation
+        return False
+
+    def browser_needs_recycle(self, port: str) -> bool:
+        browser = self.browsers.get(port)
+        if not browser:
+            return False
+        if browser.navigations >= self.max_navs_per_browser:
+            return True
+        rss_mb = self.refresh_rss(port) / (1024 * 1024)
+        return rss_mb >= self.max_browser_rss_mb
+
+    def report(self) -> dict:
+        return {
+            "limits": {
+                "max_navs_per_tab": self.max_navs_per_tab,
+                "max_navs_per_browser": self.max_navs_per_browser,
+                "max_browser_rss_mb": self.max_browser_rss_mb,
+                "latency_degradation": self.latency_degradation
+            },
+            "recycled": dict(self.recycled),
+            "browsers": {port: b.to_dict() for port, b in self.browsers.items()},
+            "tabs": {tid: t.to_dict() for tid, t in self.tabs.items()}
+        }
@@ -0,0 +1,274 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import itertools
+from typing import Optional, List, Callable, Awaitable
+# Python file imports
+from encoding import dumps_json
+
+JOBS_DIR = os.environ.get("CRAWLGRID_JOBS_DIR", "jobs")
+
+
+class SegmentWriter:
+    """
+    Appends records to gzip-compressed NDJSON segments in a directory.
+    A segment is closed after records_per_segment records, max_bytes of raw
+    NDJSON or max_age seconds, whichever comes first; only closed segments are
+    listed in the index, so readers never see a half-written gzip member.
+    """
+    def __init__(self, directory: str, prefix: str = "seg", records_per_segment: int = 500,
+                 max_bytes: int = 64 * 1024 * 1024, max_age: float = 5.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.records_per_segment = records_per_segment
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segments = []      # [{"name", "first", "count", "bytes"}]
+        self.records = 0
+        self._file = None
+        self._current = None
+        self._opened_at = 0.0
+        self._raw_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        name = f"{self.prefix}-{len(self.segments):06d}.ndjson.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+        self._current = {"name": name, "first": self.records, "count": 0}
+        self._opened_at = time.monotonic()
+        self._raw_bytes = 0
+
+    def write(self, record: dict):
+        if self._file is None:
+            self._open()
+        line = dumps_json(record) + b"\n"
+        self._file.write(line)
+        self._raw_bytes += len(line)
+        self._current["count"] += 1
+        self.records += 1
+        if self._current["count"] >= self.records_per_segment or self._raw_bytes >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Closes the open segment (if any) and publishes it in the index."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._current["bytes"] = os.path.getsize(os.path.join(self.directory, self._current["name"]))
+        self.segments.append(self._current)
+        self._file = None
+        self._current = None
+
+    def rotate_if_stale(self):
+        if self._file is not None and time.monotonic() - self._opened_at >= self.max_age:
+            self.rotate()
+
+    @property
+    def published(self) -> int:
+        """Records readable from closed segments."""
+        return sum(s["count"] for s in self.segments)
+
+
+def read_segment(path: str, skip: int = 0):
+    """Yields raw NDJSON lines from one segment, skipping the first `skip`."""
+    with gzip.open(path, "rb") as f:
+        for i, line in enumerate(f):
+            if i >= skip:
+                yield line
+
+
+async def iter_segments(directory: str, segments: List[dict], offset: int = 0):
+    """Yields NDJSON lines of the given closed segments, from record `offset` on."""
+    for segment in list(segments):
+        end = segment["first"] + segment["count"]
+        if end <= offset:
+            continue
+        reader = read_segment(os.path.join(directory, segment["name"]), max(0, offset - segment["first"]))
+        while True:
+            # Decompress in small batches off the loop; never hold a whole segment in memory
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(reader, 16)))
+            if not batch:
+                break
+            for line in batch:
+                yield line
+
+
+class Job:
+    """
+    A batch of URLs processed in the background. Input and results live on disk
+    under JOBS_DIR/<job_id>/, so memory does not grow with job size and the job
+    keeps running when the submitting client goes away.
+    """
+    def __init__(self, job_id: str, directory: str, meta: Optional[dict] = None):
+        self.id = job_id
+        self.directory = directory
+        self.meta = meta or {}
+        self.writer = None
+        self.task = None
+        self.changed = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def state(self) -> str:
+        return self.meta.get("state", "unknown")
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "cancelled", "interrupted")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def save_meta(self):
+        if self.writer is not None:
+            self.meta["segments"] = self.writer.segments
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path())
+
+    def iter_urls(self):
+        with open(os.path.join(self.directory, "urls.txt"), "r", encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                url = line.strip()
+                if url:
+                    yield index, url
+
+    async def run(self, fetch: Callable[[str], Awaitable[dict]], concurrency: int):
+        self.writer = SegmentWriter(self.directory)
+        self.meta["state"] = "running"
+        self.meta["started_at"] = time.time()
+        await asyncio.to_thread(self.save_meta)
+        urls = self.iter_urls()
+
+        async def worker():
+            for index, url in urls:
+                result = await fetch(url)
+                record = {"index": index, "url": url, **result}
+                async with self._write_lock:
+                    await asyncio.to_thread(self.writer.write, record)
+                    key = "completed" if result.get("status") == "success" else "failed"
+                    self.meta[key] = self.meta.get(key, 0) + 1
+                    self.meta["processed"] = self.meta.get("processed", 0) + 1
+                self._notify()
+
+        async def flusher():
+            # Publishes slow-filling segments so followers see results within max_age
+            while True:
+                await asyncio.sleep(1)
+                async with self._write_lock:
+                    before = len(self.writer.segments)
+                    await asyncio.to_thread(self.writer.rotate_if_stale)
+                    if len(self.writer.segments) != before:
+                        await asyncio.to_thread(self.save_meta)
+                        self._notify()
+
+        flush_task = asyncio.create_task(flusher())
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            self.meta["state"] = "done"
+        except asyncio.CancelledError:
+            self.meta["state"] = "cancelled"
+        finally:
+            flush_task.cancel()
+            async with self._write_lock:
+                await asyncio.to_thread(self.writer.rotate)
+            self.meta["finished_at"] = time.time()
+            await asyncio.to_thread(self.save_meta)
+            self._notify()
+
+    def _notify(self):
+        """Wakes every follower; each notify gets a fresh event so followers never clear each other's."""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def segments(self) -> List[dict]:
+        return self.writer.segments if self.writer is not None else self.meta.get("segments", [])
+
+    def segment_path(self, n: int) -> Optional[str]:
+        segments = self.segments()
+        if 0 <= n < len(segments):
+            return os.path.join(self.directory, segments[n]["name"])
+        return None
+
+    async def stream_results(self, offset: int = 0, follow: bool = True):
+        """Yields NDJSON lines from record `offset` on; optionally waits for more until the job ends."""
+        position = offset
+        while True:
+            # Grab the event before scanning so a notify during the scan is not missed
+            changed = self.changed
+            segments = list(self.segments())
+            async for line in iter_segments(self.directory, segments, position):
+                yield line
+            position = max(position, sum(s["count"] for s in segments))
+            if not follow or self.finished:
+                return
+            await changed.wait()
+
+    def to_dict(self) -> dict:
+        segments = self.segments()
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "total": self.meta.get("total", 0),
+            "processed": self.meta.get("processed", 0),
+            "completed": self.meta.get("completed", 0),
+            "failed": self.meta.get("failed", 0),
+            "readable": sum(s["count"] for s in segments),
+            "segments": len(segments),
+            "bytes": sum(s.get("bytes", 0) for s in segments),
+            "created_at": self.meta.get("created_at"),
+            "finished_at": self.meta.get("finished_at")
+        }
+
+
+class JobStore:
+    def __init__(self, root: str = JOBS_DIR):
+        self.root = root
+        self.jobs = {}
+        os.makedirs(root, exist_ok=True)
+
+    def load(self):
+        """Picks up jobs left on disk by a previous run; unfinished ones are marked interrupted."""
+        for job_id in os.listdir(self.root):
+            directory = os.path.join(self.root, job_id)
+            try:
+                with open(os.path.join(directory, "meta.json")) as f:
+                    meta = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            job = Job(job_id, directory, meta)
+            if not job.finished:
+                meta["state"] = "interrupted"
+                job.save_meta()
+            self.jobs[job_id] = job
+
+    def create(self, urls: List[str], options: dict) -> Job:
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(self.root, job_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, "urls.txt"), "w", encoding="utf-8") as f:
+            for url in urls:
+                f.write(url.strip() + "\n")
+        job = Job(job_id, directory, {"state": "queued", "total": len(urls), "created_at": time.time(), **options})
+        job.save_meta()
+        self.jobs[job_id] = job
+        return job
+
+    async def delete(self, job_id: str) -> bool:
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+            # Its finally still writes the last segment and meta: let it finish before removing them
+            try:
+                await job.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await asyncio.to_thread(shutil.rmtree, job.directory, True)
+        return True
@@ -1,5 +1,8 @@
 import os
 import json
+import time
+import asyncio
+import httpx
 from fastapi import FastAPI, HTTPException, Query
 from DrissionPage import ChromiumPage, ChromiumOptions
 import uvicorn
@@ -7,30 +10,108 @@ from typing import Optional
 import psutil
 from DrissionPage import ChromiumPage, ChromiumOptions
 from typing import Optional, List
+from pydantic import BaseModel, Field
 from fastapi import Request
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import FileResponse, Response
 # Python file imports
 from manage import BrowserManager
 from utils import get_active_ports, load_registry, cleanup_all_resources
+from encoding import encode_response, encode_stream, dumps_json
 
 
 manager = BrowserManager()
 app = FastAPI()
 
+class JobRequest(BaseModel):
+    urls: List[str]
+    concurrency: int = Field(10, ge=1)
+    priority: str = "bulk"
+    tenant: Optional[str] = None
+
+class BroadcastRequest(BaseModel):
+    script: str
+    as_expr: bool = False
+    # Target filters, combined; none selects every tab on the node
+    idle_only: bool = False
+    port: Optional[int] = None
+    tag: Optional[str] = None
+    tab_ids: Optional[List[str]] = None
+    timeout: float = 10.0
+    concurrency: int = Field(64, ge=1)
+    stream: bool = False
+
+class TagRequest(BaseModel):
+    tab_ids: List[str]
+    tags: List[str]
+    remove: bool = False
+
+class SessionApplyRequest(BaseModel):
+    name: str
+    # Same target filters as /broadcast-js
+    idle_only: bool = False
+    port: Optional[int] = None
+    tag: Optional[str] = None
+    tab_ids: Optional[List[str]] = None
+
+class SessionImportRequest(BaseModel):
+    name: str
+    cookies: List[dict] = []
+    origins: dict = {}
+    ttl: Optional[float] = None
+
+class CrawlRequest(BaseModel):
+    seeds: List[str]
+    allowed_domains: Optional[List[str]] = None
+    include_subdomains: bool = True
+    max_depth: int = 2
+    max_pages: Optional[int] = None
+    concurrency: int = Field(10, ge=1)
+    priority: str = "bulk"
+    tenant: Optional[str] = None
+    # Size the seen-set for every URL the crawl may discover (memory ~1.8 bytes/URL at 0.1%)
+    seen_capacity: int = 10_000_000
+    seen_error_rate: float = 0.001
+
 @app.on_event("startup")
 async def startup_event():
     """This runs once when you start the uvicorn server"""
     cleanup_all_resources()
+    manager.jobs.load()
+    manager.load_recordings()
+    asyncio.create_task(manager.health_loop())
+    asyncio.create_task(manager.loop_monitor.run())
+    # Cluster workers share one public URL: the dispatcher reports their sum instead
+    if os.environ.get("CRAWLGRID_COORDINATOR") and not os.environ.get("CRAWLGRID_WORKER_ID"):
+        asyncio.create_task(coordinator_heartbeat())
+
+async def coordinator_heartbeat():
+    """Reports this node's tab capacity to the grid coordinator (server/coordinator.py)."""
+    coordinator_url = os.environ["CRAWLGRID_COORDINATOR"].rstrip("/")
+    public_url = os.environ.get("CRAWLGRID_PUBLIC_URL", "http://localhost:8000")
+    interval = float(os.environ.get("CRAWLGRID_HEARTBEAT_INTERVAL", 5))
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while True:
+            try:
+                await client.post(f"{coordinator_url}/heartbeat", params={
+                    "url": public_url,
+                    "capacity": len(manager.tab_index),
+                    "idle": manager.tab_pool.qsize()
+                })
+            except httpx.HTTPError as e:
+                print(f"⚠️ [Grid] Heartbeat to {coordinator_url} failed: {e}")
+            await asyncio.sleep(interval)
 
 # FOR BROWSER EVENTS
 
 @app.get('/launch')
-async def launch_with_port(port: int):
-    result = manager.launch(port=port)
+async def launch_with_port(port: int, profile: str = "default"):
+    result = manager.launch(port=port, profile=profile)
     if result["status"] == "error":
         # If it's a limit issue, return 429 Forbidden
         if "limit" in result["message"]:
             raise HTTPException(status_code=429, detail=result["message"])
+        if "Unknown profile" in result["message"]:
+            raise HTTPException(status_code=400, detail=result["message"])
         raise HTTPException(status_code=500, detail=result["message"])
     return result
 
@@ -55,11 +136,17 @@ async def kill_with_port(port: int):
     return result
 
 @app.post('/get-url')
-async def get_url(url: str, release_tab: bool = True):
-    result = await manager.get_url(url, release_tab)
+async def get_url(request: Request, url: str, release_tab: bool = True, priority: str = "default", tenant: Optional[str] = None,
+                  record: bool = False, session: Optional[str] = None):
+    result = await manager.get_url(url, release_tab, priority=priority, tenant=tenant, record=record, session=session)
     if result["status"] == "error":
         raise HTTPException(status_code=404, detail=result)
-    return result
+    # Encoding + compressing a multi-MB page is CPU work: keep it off the event loop.
+    # X-Tab-Id lets a cluster dispatcher learn tab ownership without parsing the body.
+    headers = {"X-Tab-Id": result["tab_id"]}
+    if "recording_id" in result:
+        headers["X-Recording-Id"] = result["recording_id"]
+    return await asyncio.to_thread(encode_response, request, result, headers)
 
 @app.post('/release-tab')
 async def release_tab(tab_id: str):
@@ -77,10 +164,7 @@ async def get_element(tab_id: str, xpath: str, click: bool = False, input_text:
 
 @app.get('/listen')
 async def listen_network(request: Request, tab_id: str, targets: Optional[str] = Query(None)):
-    return StreamingResponse(
-        manager.listen_generator(request, tab_id, targets),
-        media_type="text/event-stream"
-    )
+    return encode_stream(request, manager.listen_generator(request, tab_id, targets), "text/event-stream")
 
 @app.get('/stop-listen')
 async def stop_listen(tab_id: str):
@@ -90,6 +174,24 @@ async def stop_listen(tab_id: str):
         return {"status": "success", "message": f"Stop signal sent to listener {tab_id}"}
     return {"status": "error", "message": "No active listener found for this tab"}
 
+@app.get('/watch')
+async def watch_dom(
+    request: Request,
+    tab_id: str,
+    selector: List[str] = Query(..., description="CSS selector or 'xpath:...'; repeat for several"),
+    once: bool = False,
+    timeout: Optional[float] = None,
+    debounce_ms: int = Query(100, ge=0, le=10000)
+):
+    return encode_stream(
+        request, manager.watch_generator(request, tab_id, selector, once, timeout, debounce_ms), "text/event-stream"
+    )
+
+@app.get('/stop-watch')
+async def stop_watch(watch_id: str, tab_id: Optional[str] = None):
+    # tab_id is unused here but lets the cluster route the call to the owning node
+    return manager.stop_watch(watch_id)
+
 @app.get('/screenshot')
 async def get_screenshot(tab_id: str = Query(...), name: Optional[str] = "screenshot.png"):
     file_path = await manager.take_screenshot(tab_id, name)
@@ -97,6 +199,99 @@ async def get_screenshot(tab_id: str = Query(...), name: Optional[str] = "screen
         raise HTTPException(status_code=404, detail="Screenshot failed or tab not found")
     return FileResponse(file_path, media_type="image/png", filename=name)
 
+@app.get('/tabs')
+async def list_tabs():
+    """Every tab this node owns, with its browser port and lease state."""
+    return {
+        tid: {"port": int(data["port"]), "leased": tid in manager.leased, "tags": sorted(data["tags"])}
+        for tid, data in manager.tab_index.items()
+    }
+
+@app.post('/tag-tabs')
+async def tag_tabs(req: TagRequest):
+    return manager.tag_tabs(req.tab_ids, req.tags, req.remove)
+
+@app.post('/broadcast-js')
+async def broadcast_js(request: Request, req: BroadcastRequest):
+    """
+    Runs one script on many tabs in parallel with a per-tab timeout.
+    Results come back all at once, or with stream=true as NDJSON lines in completion order.
+    """
+    targets = manager.select_tabs(req.idle_only, req.port, req.tag, req.tab_ids)
+    results = manager.broadcast_js(req.script, targets, req.timeout, req.concurrency, req.as_expr)
+
+    if req.stream:
+        async def lines():
+            async for outcome in results:
+                yield dumps_json(outcome) + b"\n"
+        return encode_stream(request, lines(), "application/x-ndjson")
+
+    collected = [outcome async for outcome in results]
+    return await asyncio.to_thread(encode_response, request, {
+        "status": "success",
+        "total": len(collected),
+        "succeeded": sum(1 for r in collected if r["status"] == "success"),
+        "results": collected
+    })
+
+# SESSION STATE
+
+@app.post('/session-snapshot')
+async def session_snapshot(tab_id: str, name: str, ttl: Optional[float] = None, all_cookies: bool = False):
+    """Saves the tab's cookies and current-origin storage under `name` (in memory, with expiry)."""
+    result = await manager.snapshot_session(tab_id, name, ttl, all_cookies)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+@app.post('/session-apply')
+async def session_apply(req: SessionApplyRequest):
+    """Injects a saved session into the selected tabs ahead of their next navigation."""
+    targets = manager.select_tabs(req.idle_only, req.port, req.tag, req.tab_ids)
+    result = await manager.apply_session_to_tabs(req.name, targets)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+@app.get('/sessions')
+async def list_sessions():
+    return manager.sessions.list()
+
+@app.get('/session-export')
+async def session_export(name: str):
+    """Full snapshot (credentials included), for importing on another node."""
+    snapshot = manager.sessions.get(name)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Session '{name}' not found or expired.")
+    return {**snapshot, "expires_in": snapshot["expires_at"] - time.time()}
+
+@app.post('/session-import')
+async def session_import(req: SessionImportRequest):
+    state = {"cookies": req.cookies, "origins": req.origins}
+    return {"status": "success", "session": manager.sessions.put(req.name, state, req.ttl)}
+
+@app.post('/session-delete')
+async def session_delete(name: str):
+    if not manager.sessions.delete(name):
+        raise HTTPException(status_code=404, detail=f"Session '{name}' not found.")
+    return {"status": "success", "message": f"Session '{name}' deleted."}
+
+@app.get('/debug/loop-lag')
+async def debug_loop_lag():
+    """Event-loop stalls past the threshold, newest first, with the stack that was blocking."""
+    return manager.loop_monitor.report()
+
+@app.get('/debug/slow-navigations')
+async def debug_slow_navigations():
+    """The slowest recent navigations: server-side stages plus the browser's Navigation Timing."""
+    return manager.slow_navigations.report()
+
+@app.get('/profiles')
+async def list_profiles():
+    """Launch profiles with their launch times and the live RSS of browsers using them."""
+    registry = load_registry()
+    return await asyncio.to_thread(manager.profile_stats.report, registry)
+
 @app.get('/list-browsers')
 async def list_browsers():
     return get_active_ports()
@@ -115,9 +310,204 @@ async def get_node_status():
     return {
         "browsers": f"{browser_count}/{manager.MAX_BROWSERS}",
         "total_tabs": total_tabs,
-        "available_slots": manager.MAX_BROWSERS - browser_count
+        "available_slots": manager.MAX_BROWSERS - browser_count,
+        "pooled_tabs": len(manager.tab_index),
+        "idle_tabs": manager.tab_pool.qsize()
     }
 
+@app.get('/health')
+async def get_health():
+    """Per-tab and per-browser health, plus what has been recycled so far."""
+    report = manager.health.report()
+    report["draining"] = sorted(manager.draining)
+    return report
+
+@app.post('/recycle-browser')
+async def recycle_browser(port: int):
+    result = await manager.recycle_browser(str(port))
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+# FOR BATCH JOBS
+
+@app.post('/jobs')
+async def submit_job(request: JobRequest, response: Response):
+    result = manager.submit_job(**request.dict())
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result)
+    # Lets a cluster dispatcher route later job calls to this worker
+    response.headers["X-Job-Id"] = result["job_id"]
+    return result
+
+@app.get('/jobs')
+async def list_jobs():
+    return [job.to_dict() for job in manager.jobs.jobs.values()]
+
+@app.get('/job-status')
+async def job_status(job_id: str):
+    job = manager.jobs.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job.to_dict()
+
+@app.get('/job-results')
+async def job_results(request: Request, job_id: str, offset: int = 0, follow: bool = True):
+    """NDJSON records from `offset` on; with follow, stays open until the job finishes."""
+    job = manager.jobs.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return encode_stream(request, job.stream_results(offset, follow), "application/x-ndjson")
+
+@app.get('/job-segment')
+async def job_segment(job_id: str, segment: int):
+    """One finished, gzip-compressed NDJSON segment, as stored on disk."""
+    job = manager.jobs.jobs.get(job_id)
+    path = job.segment_path(segment) if job else None
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Segment not found.")
+    return FileResponse(path, media_type="application/gzip", filename=os.path.basename(path))
+
+@app.post('/job-cancel')
+async def job_cancel(job_id: str):
+    job = manager.jobs.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    if job.task is not None and not job.task.done():
+        job.task.cancel()
+    return {"status": "success", "message": f"Cancel signal sent to job {job_id}"}
+
+@app.post('/job-delete')
+async def job_delete(job_id: str):
+    if not await manager.jobs.delete(job_id):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return {"status": "success", "message": f"Job {job_id} deleted."}
+
+# FOR CRAWL JOBS
+
+@app.post('/crawl')
+async def start_crawl(request: CrawlRequest, response: Response):
+    result = manager.start_crawl(**request.dict())
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result)
+    response.headers["X-Job-Id"] = result["job_id"]
+    return result
+
+@app.get('/crawl-status')
+async def crawl_status(job_id: str):
+    job = manager.crawl_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Crawl {job_id} not found.")
+    return job.to_dict()
+
+@app.post('/crawl-stop')
+async def crawl_stop(job_id: str):
+    job = manager.crawl_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Crawl {job_id} not found.")
+    job.stop()
+    return {"status": "success", "message": f"Stop signal sent to crawl {job_id}"}
+
+@app.get('/crawls')
+async def list_crawls():
+    return {jid: {"state": job.state, **job.stats} for jid, job in manager.crawl_jobs.items()}
+
+# FOR NETWORK RECORDING
+
+@app.post('/record-start')
+async def record_start(response: Response, tab_id: str, bodies: bool = True):
+    result = await manager.start_recording(tab_id, bodies)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    response.headers["X-Recording-Id"] = result["recording_id"]
+    return result
+
+@app.post('/record-stop')
+async def record_stop(recording_id: str):
+    result = await manager.stop_recording(recording_id)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+@app.get('/recordings')
+async def list_recordings():
+    return [r.to_dict() for r in manager.recordings.values()]
+
+@app.get('/recording-status')
+async def recording_status(recording_id: str):
+    return _get_recording(recording_id).to_dict()
+
+@app.post('/recording-delete')
+async def recording_delete(recording_id: str):
+    if not await manager.delete_recording(recording_id):
+        raise HTTPException(status_code=404, detail=f"Recording {recording_id} not found.")
+    return {"status": "success", "message": f"Recording {recording_id} deleted."}
+
+def _get_recording(recording_id: str):
+    recorder = manager.recordings.get(recording_id)
+    if not recorder:
+        raise HTTPException(status_code=404, detail=f"Recording {recording_id} not found.")
+    return recorder
+
+@app.get('/recording-entries')
+async def recording_entries(request: Request, recording_id: str, offset: int = 0):
+    """HAR entries as NDJSON; bodies are referenced by their `_file` path."""
+    return encode_stream(request, _get_recording(recording_id).entries(offset), "application/x-ndjson")
+
+@app.get('/recording-har')
+async def recording_har(request: Request, recording_id: str):
+    return encode_stream(request, _get_recording(recording_id).har_chunks(), "application/json")
+
+@app.get('/recording-segment')
+async def recording_segment(recording_id: str, segment: int):
+    path = _get_recording(recording_id).segment_path(segment)
+    if not path:
+        raise HTTPException(status_code=404, detail="Segment not found.")
+    return FileResponse(path, media_type="application/gzip", filename=os.path.basename(path))
+
+@app.get('/recording-body')
+async def recording_body(recording_id: str, digest: str):
+    path = _get_recording(recording_id).body_path(digest)
+    if not path:
+        raise HTTPException(status_code=404, detail="Body not found.")
+    return FileResponse(path, media_type="application/octet-stream", filename=digest)
+
+# FOR THE RESPONSE CACHE
+
+@app.get('/cache')
+async def cache_stats():
+    return manager.cache.report()
+
+@app.post('/cache-mode')
+async def set_cache_mode(mode: str, max_mb: Optional[int] = None):
+    result = await manager.set_cache_mode(mode, max_mb)
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result)
+    return result
+
+@app.post('/cache-clear')
+async def cache_clear():
+    await asyncio.to_thread(manager.cache.clear)
+    return {"status": "success", "message": "Response cache cleared."}
+
+@app.get('/scheduler')
+async def scheduler_stats():
+    """Idle tabs, queue depth per class/tenant and per-class wait times."""
+    return manager.tab_pool.stats()
+
+@app.post('/scheduler/domain-policy')
+async def set_domain_policy(domain: str, max_concurrency: Optional[int] = None, rate: Optional[float] = None, burst: int = 1):
+    manager.tab_pool.set_domain_policy(domain, max_concurrency, rate, burst)
+    return {"status": "success", "domain": domain, "policy": manager.tab_pool.stats()["domain_policies"][domain]}
+
+@app.post('/scheduler/tenant-weight')
+async def set_tenant_weight(tenant: str, weight: float):
+    try:
+        manager.tab_pool.set_tenant_weight(tenant, weight)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "tenant": tenant, "weight": weight}
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run("main:app", host='localhost', port=8000)
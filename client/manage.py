@@ -1,39 +1,86 @@
 import os
+import time
+import shutil
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
 from DrissionPage import ChromiumPage, ChromiumOptions
 from fastapi import Request
 from fastapi.responses import StreamingResponse
 import json
+from urllib.parse import urlparse
 # Python file imports
 from utils import load_registry, save_registry, is_process_running, kill_process_tree, update_registry
+from utils import add_registry_tab, remove_registry_tab, find_free_port, remove_user_data_dir, REGISTRY_FILE
+from health import HealthTracker
+from scheduler import TabScheduler
+from crawl import CrawlJob, CrawlScope, EXTRACT_LINKS_JS
+from jobs import JobStore
+from encoding import dumps_json
+from response_cache import ResponseCache, CacheInterceptor, CACHE_MODES
+from recorder import NetworkRecorder, RECORDINGS_DIR
+from profiles import LAUNCH_PROFILES, ProfileStats, build_options, prepare_user_data_dir
+from dom_watch import DomWatcher
+from session_store import SessionStore, capture_session, apply_session, remove_session
+from diagnostics import LoopLagMonitor, SlowNavigations, NAV_TIMING_JS, navigation_stages
 
 class BrowserManager:
     def __init__(self):
-        self.MAX_BROWSERS = 10  # Hard limit
+        self.MAX_BROWSERS = int(os.environ.get("CRAWLGRID_MAX_BROWSERS", 10))  # Hard limit
         self.MAX_TABS_PER_BROWSER = 10
-        self.tab_pool = asyncio.Queue()
         self.tab_index = {}
+        # Priority / per-domain / per-tenant scheduler over the idle tabs
+        self.tab_pool = TabScheduler(is_valid=lambda tab_data: tab_data["tab_id"] in self.tab_index)
         # Ensure registry exists on init
-        if not os.path.exists("browser_registry.json"):
+        if not os.path.exists(REGISTRY_FILE):
             save_registry({})
         self.active_elements = {}
+        # Tab/browser recycling state
+        self.health = HealthTracker()
+        self.leased = set()      # tab_ids currently handed out to a request
+        self.draining = set()    # ports being replaced; their tabs are retired on release
+        self.BROWSER_DRAIN_TIMEOUT = 120
+        self.crawl_jobs = {}
+        self.MAX_FINISHED_CRAWLS = 100
+        self.jobs = JobStore()
+        # Optional node-wide response cache shared by every tab (CDP Fetch interception)
+        self.cache = ResponseCache(
+            max_bytes=int(os.environ.get("CRAWLGRID_CACHE_MAX_MB", 2048)) * 1024 * 1024,
+            mode=os.environ.get("CRAWLGRID_CACHE_MODE", "off")
+        )
+        self.cache_interceptor = CacheInterceptor(self.cache)
+        self.recordings = {}
+        self.MAX_RECORDINGS = int(os.environ.get("CRAWLGRID_MAX_RECORDINGS", 200))
+        self.profile_stats = ProfileStats()
+        self.dom_watchers = {}   # tab_id -> DomWatcher (in-page observers pushing DOM events)
+        # Debug: event-loop stall sampling and the slowest recent navigations
+        self.loop_monitor = LoopLagMonitor(threshold=float(os.environ.get("CRAWLGRID_LOOP_LAG_THRESHOLD", 0.25)))
+        self.slow_navigations = SlowNavigations()
+        self.sessions = SessionStore()
+        # port -> {(name, domain, path): leases using it}; an injected cookie leaves the jar with its last lease
+        self.session_cookies = {}
     
-    def launch(self, port: Optional[int] = None) -> dict:
+    def launch(self, port: Optional[int] = None, force: bool = False, profile: str = "default") -> dict:
         registry = load_registry()
         
-        # 1. Check Browser Limit
-        if len(registry) >= self.MAX_BROWSERS and str(port) not in registry:
+        # 1. Check Browser Limit (force lets a replacement briefly overlap the browser it replaces)
+        if not force and len(registry) >= self.MAX_BROWSERS and str(port) not in registry:
             return {
                 "status": "error", 
                 "message": f"Browser limit reached ({self.MAX_BROWSERS}). Cannot launch more."
             }
+        if profile not in LAUNCH_PROFILES:
+            return {"status": "error", "message": f"Unknown profile '{profile}'. Use one of {list(LAUNCH_PROFILES)}."}
+
+        user_data_dir = None
         try:
-            co = ChromiumOptions()
-            if port is not None:
-                co.set_local_port(port)
+            user_data_dir = prepare_user_data_dir(port, LAUNCH_PROFILES[profile])
+            co = build_options(profile, port, user_data_dir)
             
+            started = time.perf_counter()
             page = ChromiumPage(co)
+            launch_seconds = time.perf_counter() - started
+            self.profile_stats.record_launch(profile, launch_seconds)
             actual_port = str(page.address.split(':')[-1])
             pid = page.process_id
             
@@ -43,16 +90,22 @@ class BrowserManager:
             registry[actual_port] = {
                 "process_id": pid,
                 "tabs": tab_data,
-                "status": "running"
+                "status": "running",
+                "profile": profile,
+                "user_data_dir": user_data_dir
             }
             save_registry(registry)
+            self.health.track_browser(actual_port, pid)
             
             return {
                 "status": "success",
                 "port": int(actual_port),
-                "tab_ids": list(tab_data.keys())
+                "tab_ids": list(tab_data.keys()),
+                "profile": profile,
+                "launch_seconds": round(launch_seconds, 3)
             }
         except Exception as e:
+            remove_user_data_dir(user_data_dir)
             return {"status": "error", "message": f"Launch failed: {str(e)}"}
 
     def get_browser(self, port: int) -> ChromiumPage:
@@ -62,7 +115,8 @@ class BrowserManager:
         if port_str in registry:
             pid = registry[port_str].get("process_id")
             if not is_process_running(pid):
-                self.launch(port=port)
+                remove_user_data_dir(registry[port_str].get("user_data_dir"))
+                self.launch(port=port, profile=registry[port_str].get("profile", "default"))
         
         return ChromiumPage(ChromiumOptions().set_local_port(port))
 
@@ -78,10 +132,19 @@ class BrowserManager:
             tabs_to_remove = [tid for tid, data in self.tab_index.items() if data['port'] == port_str]
             for tid in tabs_to_remove:
                 del self.tab_index[tid]
+                self.leased.discard(tid)
+                # A leased tab can no longer be released: free its domain/origin slot now
+                self.tab_pool.forget(tid)
+                self.cache_interceptor.attached.discard(tid)
+                self.dom_watchers.pop(tid, None)
+            self.health.forget_browser(port_str)
+            self.draining.discard(port_str)
+            self.session_cookies.pop(port_str, None)
             
             # Kill process and registry as before...
             pid = registry[port_str]["process_id"]
             kill_process_tree(pid)
+            remove_user_data_dir(registry[port_str].get("user_data_dir"))
             del registry[port_str]
             save_registry(registry)
             return {"status": "success", "message": f"Port {port} terminated."}
@@ -94,7 +157,7 @@ class BrowserManager:
         """
         try:
             registry = load_registry()
-            active_ports = list(registry.keys())
+            active_ports = [p for p in registry.keys() if p not in self.draining]
             if not active_ports:
                 return {"status": "error", "message": "No active browsers."}
 
@@ -126,14 +189,12 @@ class BrowserManager:
                         # Physical creation
                         new_tab = page.new_tab()
                         tab_id = new_tab.tab_id
+                        self.cache_interceptor.attach(new_tab)
                         # Put into the LIVE memory pool
-                        tab_data = {
-                            "port": port_str, 
-                            "obj": new_tab, 
-                            "tab_id": tab_id
-                        }
+                        tab_data = self._new_tab_data(port_str, new_tab)
                         await self.tab_pool.put(tab_data)
                         self.tab_index[tab_id] = tab_data
+                        self.health.track_tab(tab_id, port_str)
 
                         # Update Registry data
                         current_tabs[new_tab.tab_id] = {"status": "idle", "url": "about:blank"}
@@ -236,21 +297,38 @@ class BrowserManager:
     #     except Exception as e:
     #         return {"status": "error", "message": f"Sync failed: {str(e)}"}
 
-    async def get_url(self, url: str, release_tab: bool = True) -> dict:
+    async def _acquire(self, url: str, priority: str = "default", tenant: Optional[str] = None) -> dict:
+        """
+        Waits for an idle tab from the scheduler and marks it leased.
+        If none is free (or the domain is at its limit), this pauses without blocking the server.
+        Tabs that recently served the same origin are preferred, so DNS/TLS/cache stay warm.
+        Tabs invalidated by a kill operation are skipped by the scheduler.
+        """
+        parsed = urlparse(url)
+        tab_data = await self.tab_pool.get(
+            priority=priority,
+            domain=parsed.hostname,
+            tenant=tenant,
+            origin=f"{parsed.scheme}://{parsed.netloc}" if parsed.netloc else None
+        )
+        self.leased.add(tab_data["tab_id"])
+        if tab_data.get("session_applied"):
+            # This lease is the one injected session state was waiting for
+            tab_data["session_used"] = True
+        return tab_data
+
+    async def get_url(self, url: str, release_tab: bool = True, priority: str = "default", tenant: Optional[str] = None,
+                      record: bool = False, session: Optional[str] = None) -> dict:
         """Uses the in-memory tab pool for near-instant URL processing."""
         tab_data = None
+        recorder = None
+        if session is not None and self.sessions.get(session) is None:
+            return {"status": "error", "message": f"Session '{session}' not found or expired."}
         try:
-            while True:
-                # 1. Acquire: Wait for an idle tab from the memory queue
-                # If the queue is empty, this will pause here without blocking the server
-                tab_data = await self.tab_pool.get()
-                
-                # Check if tab was invalidated by a kill operation
-                if tab_data["tab_id"] not in self.tab_index:
-                    self.tab_pool.task_done()
-                    tab_data = None
-                    continue
-                break
+            # 1. Acquire: Wait for an idle tab from the scheduler
+            acquire_started = time.perf_counter()
+            tab_data = await self._acquire(url, priority, tenant)
+            stages = {"acquire": time.perf_counter() - acquire_started}
 
             tab_obj = tab_data["obj"]
             port = tab_data["port"]
@@ -259,19 +337,25 @@ class BrowserManager:
             # 2. Work: Navigate in a separate thread
             # This prevents tab.get() from freezing your entire FastAPI application
             def perform_navigation():
+                mark = time.perf_counter()
                 # Start listening for network traffic
                 # target_urls allows us to filter specifically for the main request
                 tab_obj.listen.start(targets=url)
                 
                 # Navigate
                 tab_obj.get(url, timeout=5)
+                stages["navigate"] = time.perf_counter() - mark
+                mark = time.perf_counter()
                 
                 # Catch the specific packet for the URL we requested
                 res_packet = tab_obj.listen.wait(timeout=5)
+                stages["wait_response"] = time.perf_counter() - mark
+                mark = time.perf_counter()
                 
                 # Extract Data
                 html = tab_obj.html
                 cookies = tab_obj.cookies().as_json()
+                stages["extract"] = time.perf_counter() - mark
                 
                 if res_packet:
                     request_headers = dict(res_packet.request.headers)
@@ -284,12 +368,30 @@ class BrowserManager:
                 return html, request_headers, cookies
 
             print(f"🚀 [Grid] Assigning {url} to Port {port} | Tab {tab_id}")
+            if session is not None:
+                await self._apply_session(tab_data, session)
+            if record:
+                # One recorder per tab: DrissionPage keeps a single callback per CDP event
+                if self._is_recording(tab_id):
+                    raise RuntimeError(f"Tab {tab_id} is already being recorded.")
+                # Per-request archive: everything this navigation loads goes to disk
+                recorder = NetworkRecorder(tab_obj, tab_id)
+                await asyncio.to_thread(recorder.start)
+                self.recordings[recorder.id] = recorder
+
+            started = time.perf_counter()
             html, headers, cookies = await asyncio.to_thread(perform_navigation)
+            self.health.record_navigation(port, tab_id, time.perf_counter() - started)
+
+            total = time.perf_counter() - acquire_started
+            if self.slow_navigations.observe(total):
+                # Only navigations slow enough to be kept pay for the extra round trip
+                await self._record_slow_navigation(tab_obj, url, port, tab_id, total, stages)
 
             # 3. Update Status (Background/Optional)
             update_registry(port, tab_id, "busy", url)
             
-            return {
+            result = {
                 "status": "success",
                 "port": port,
                 "tab_id": tab_id,
@@ -299,21 +401,107 @@ class BrowserManager:
                 "headers": headers,
                 "cookies": cookies
             }
+            if recorder is not None:
+                result["recording_id"] = recorder.id
+            return result
 
         except Exception as e:
             print(f"❌ [Grid] Error processing {url}: {e}")
             return {"status": "error", "message": str(e)}
 
         finally:
+            # Could already be stopped (and deleted) through /recording-delete
+            if recorder is not None and recorder.state == "recording":
+                await asyncio.to_thread(recorder.stop)
+                await self.prune_recordings()
             if tab_data is not None:
                 if release_tab:
-                    if tab_data["tab_id"] in self.tab_index:
-                        # 4. Release: Crucial! Put the tab back into the pool so others can use it
-                        await self.tab_pool.put(tab_data)
-                        update_registry(tab_data["port"], tab_data["tab_id"], "idle", "about:blank")
+                    # 4. Release: Crucial! Put the tab back into the pool so others can use it
+                    # (shielded: a cancelled request must not leave the tab half-returned)
+                    await asyncio.shield(self._return_tab(tab_data))
 
-                # Signal that the processing for this specific item is done
-                self.tab_pool.task_done()
+    async def _record_slow_navigation(self, tab_obj, url: str, port: str, tab_id: str, total: float, stages: dict):
+        try:
+            raw = await asyncio.to_thread(tab_obj.run_js, NAV_TIMING_JS)
+            timing = json.loads(raw) if raw else None
+        except Exception:
+            timing = None
+        self.slow_navigations.add(total, {
+            "url": url,
+            "port": port,
+            "tab_id": tab_id,
+            "stages": {name: round(seconds * 1000, 1) for name, seconds in stages.items()},
+            "browser_stages": navigation_stages(timing),
+            "navigation_timing": timing
+        })
+
+    async def crawl_page(self, url: str, priority: str = "bulk", tenant: Optional[str] = None) -> dict:
+        """Navigates and returns only the page's outgoing links (extracted in the tab)."""
+        tab_data = None
+        try:
+            tab_data = await self._acquire(url, priority, tenant)
+            tab_obj = tab_data["obj"]
+
+            def perform_crawl():
+                tab_obj.get(url, timeout=10)
+                return tab_obj.run_js(EXTRACT_LINKS_JS) or []
+
+            started = time.perf_counter()
+            links = await asyncio.to_thread(perform_crawl)
+            self.health.record_navigation(tab_data["port"], tab_data["tab_id"], time.perf_counter() - started)
+            return {"status": "success", "url": url, "links": links}
+
+        except Exception as e:
+            return {"status": "error", "url": url, "message": str(e)}
+
+        finally:
+            if tab_data is not None:
+                await asyncio.shield(self._return_tab(tab_data))
+
+    def start_crawl(self, seeds: List[str], allowed_domains: Optional[List[str]] = None, max_depth: int = 2,
+                    max_pages: Optional[int] = None, concurrency: int = 10, include_subdomains: bool = True,
+                    priority: str = "bulk", tenant: Optional[str] = None,
+                    seen_capacity: int = 10_000_000, seen_error_rate: float = 0.001) -> dict:
+        """
+        Starts a server-side crawl in the background and returns its job id.
+        seen_capacity should cover every URL the crawl may discover: past it the
+        seen-set starts dropping new URLs as duplicates.
+        """
+        if not seeds:
+            return {"status": "error", "message": "At least one seed URL is required."}
+        if seen_capacity < 1 or not 0 < seen_error_rate < 1:
+            return {"status": "error", "message": "seen_capacity must be positive and seen_error_rate in (0, 1)."}
+        self._prune_crawl_jobs()
+
+        # Default scope: the seeds' own hosts
+        domains = allowed_domains or sorted({urlparse(s).hostname for s in seeds if urlparse(s).hostname})
+        job = CrawlJob(
+            lambda url: self.crawl_page(url, priority=priority, tenant=tenant),
+            seeds, CrawlScope(domains, include_subdomains, max_depth),
+            max_pages=max_pages, concurrency=concurrency,
+            seen_capacity=seen_capacity, seen_error_rate=seen_error_rate
+        )
+        self.crawl_jobs[job.id] = job
+        asyncio.create_task(job.run())
+        return {"status": "success", "job_id": job.id, "enqueued": job.stats["enqueued"], "domains": domains}
+
+    def _prune_crawl_jobs(self):
+        """Keeps the status of the most recent MAX_FINISHED_CRAWLS finished crawls."""
+        finished = sorted((j for j in self.crawl_jobs.values() if j.finished_at), key=lambda j: j.finished_at)
+        for job in finished[:max(0, len(finished) - self.MAX_FINISHED_CRAWLS)]:
+            del self.crawl_jobs[job.id]
+
+    def submit_job(self, urls: List[str], concurrency: int = 10, priority: str = "bulk", tenant: Optional[str] = None) -> dict:
+        """Spools a URL batch to disk and processes it in the background."""
+        if not urls:
+            return {"status": "error", "message": "No URLs submitted."}
+
+        job = self.jobs.create(urls, {"priority": priority, "tenant": tenant, "concurrency": concurrency})
+        job.task = asyncio.create_task(job.run(
+            lambda url: self.get_url(url, True, priority=priority, tenant=tenant),
+            concurrency
+        ))
+        return {"status": "success", "job_id": job.id, "total": len(urls)}
 
     async def get_element(self, tab_id: str, xpath: str, click: bool = False, input_text: str = None, timeout: int = 10):
         try:
@@ -422,7 +610,7 @@ class BrowserManager:
 
                     try:
                         # Ensure the dump itself doesn't crash the generator
-                        yield f"data: {json.dumps(packet_payload)}\n\n"
+                        yield b"data: " + dumps_json(packet_payload) + b"\n\n"
                     except (TypeError, ValueError) as e:
                         yield f"data: {json.dumps({'error': 'serialization_failed', 'details': str(e)})}\n\n"
                 
@@ -439,6 +627,66 @@ class BrowserManager:
             # Optional: Signal the client that the stream is closing gracefully
             # yield "data: [DONE]\n\n"
 
+    async def watch_generator(self, request: Request, tab_id: str, selectors: List[str], once: bool = False,
+                              timeout: Optional[float] = None, debounce_ms: int = 100):
+        """
+        Pushes DOM events for the selectors (CSS, or "xpath:..." prefixed) as SSE.
+        An in-page MutationObserver does the matching; nothing is polled from here.
+        With once=True the stream ends at the first "appear" (a push-based wait_for).
+        """
+        tab_data = self.tab_index.get(tab_id)
+        if not tab_data:
+            yield b"data: " + dumps_json({"status": "error", "message": "Tab not found"}) + b"\n\n"
+            return
+
+        watcher = self.dom_watchers.get(tab_id)
+        if watcher is None:
+            watcher = self.dom_watchers[tab_id] = DomWatcher(tab_data["obj"])
+        queue = asyncio.Queue()
+        try:
+            watch_id = await asyncio.to_thread(watcher.add, selectors, asyncio.get_running_loop(), queue, debounce_ms)
+        except Exception as e:
+            yield b"data: " + dumps_json({"status": "error", "message": str(e)}) + b"\n\n"
+            return
+
+        stream_id = f"watch_{watch_id}"
+        self.active_elements[stream_id] = tab_id
+        deadline = time.monotonic() + timeout if timeout else None
+        yield b"data: " + dumps_json({"status": "watching", "watch_id": watch_id, "tab_id": tab_id}) + b"\n\n"
+
+        try:
+            # Ends on /stop-watch, tab release, client disconnect or timeout
+            while self.active_elements.get(stream_id) and watch_id in watcher.watches:
+                if await request.is_disconnected():
+                    break
+                if deadline and time.monotonic() > deadline:
+                    yield b"data: " + dumps_json({"status": "timeout", "watch_id": watch_id}) + b"\n\n"
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                yield b"data: " + dumps_json(event) + b"\n\n"
+                if once and event.get("event") == "appear":
+                    break
+        finally:
+            self.active_elements.pop(stream_id, None)
+            await asyncio.to_thread(watcher.remove, watch_id)
+
+    def stop_watch(self, watch_id: str) -> dict:
+        if self.active_elements.pop(f"watch_{watch_id}", None) is None:
+            return {"status": "error", "message": f"Watch {watch_id} not found."}
+        return {"status": "success", "message": f"Watch {watch_id} stopped."}
+
+    async def _drop_watches(self, tab_id: str):
+        """A tab going back to the pool must not keep a previous lessee's observers."""
+        watcher = self.dom_watchers.pop(tab_id, None)
+        if watcher is None:
+            return
+        for watch_id in list(watcher.watches):
+            self.active_elements.pop(f"watch_{watch_id}", None)
+            await asyncio.to_thread(watcher.remove, watch_id)
+
     async def take_screenshot(self, tab_id: str, name: str = "screenshot.png") -> Optional[str]:
         try:
             tab_data = self.tab_index.get(tab_id)
@@ -461,10 +709,407 @@ class BrowserManager:
             if tab_id not in self.tab_index:
                 return {"status": "error", "message": f"Tab {tab_id} not found."}
             
-            tab_data = self.tab_index[tab_id]
-            await self.tab_pool.put(tab_data)
-            update_registry(tab_data["port"], tab_id, "idle", "about:blank")
+            if tab_id not in self.leased:
+                # Already idle: putting it back again would hand it to two requests
+                return {"status": "success", "message": f"Tab {tab_id} is already idle."}
+
+            await self._return_tab(self.tab_index[tab_id])
             
             return {"status": "success", "message": f"Tab {tab_id} released."}
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
+
+    # --- BROADCAST ---
+
+    def tag_tabs(self, tab_ids: List[str], tags: List[str], remove: bool = False) -> dict:
+        missing = [tid for tid in tab_ids if tid not in self.tab_index]
+        for tid in tab_ids:
+            if tid in self.tab_index:
+                if remove:
+                    self.tab_index[tid]["tags"].difference_update(tags)
+                else:
+                    self.tab_index[tid]["tags"].update(tags)
+        return {"status": "success", "tagged": len(tab_ids) - len(missing), "missing": missing}
+
+    def select_tabs(self, idle_only: bool = False, port: Optional[int] = None, tag: Optional[str] = None,
+                    tab_ids: Optional[List[str]] = None) -> List[dict]:
+        """Tabs matching every given filter; no filter selects every tab on the node."""
+        selected = []
+        for tid, data in self.tab_index.items():
+            if idle_only and tid in self.leased:
+                continue
+            if port is not None and data["port"] != str(port):
+                continue
+            if tag is not None and tag not in data["tags"]:
+                continue
+            if tab_ids is not None and tid not in tab_ids:
+                continue
+            selected.append(data)
+        return selected
+
+    async def broadcast_js(self, script: str, targets: List[dict], timeout: float = 10.0,
+                           concurrency: int = 64, as_expr: bool = False):
+        """
+        Runs the script on every target tab in parallel, yielding one result per tab as it finishes.
+        Idle targets are taken out of the pool for the run so no request is handed a tab mid-script;
+        leased targets run in place, on behalf of whoever holds them.
+        """
+        reserved = set()
+        for data in targets:
+            if data["tab_id"] not in self.leased and self.tab_pool.take(data["tab_id"]) is not None:
+                self.leased.add(data["tab_id"])
+                reserved.add(data["tab_id"])
+
+        # Own pool: the default executor is far too small to cover a full node at once
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets))),
+                                      thread_name_prefix="broadcast")
+        loop = asyncio.get_running_loop()
+        running = {}    # tab_id -> executor future still driving the tab
+
+        async def give_back(data: dict):
+            """Returns a reserved tab, shielded from the caller's cancellation; a thread still using it keeps it until done."""
+            reserved.discard(data["tab_id"])
+            future = running.pop(data["tab_id"], None)
+            if future is None or future.done():
+                await asyncio.shield(self._return_tab(data))
+                return
+
+            async def release_when_done():
+                await asyncio.wait([future])
+                await self._return_tab(data)
+
+            asyncio.create_task(release_when_done())
+
+        async def run_one(data: dict) -> dict:
+            started = time.perf_counter()
+            outcome = {"tab_id": data["tab_id"], "port": int(data["port"])}
+            future = running[data["tab_id"]] = loop.run_in_executor(
+                executor, lambda: data["obj"].run_js(script, as_expr=as_expr, timeout=timeout)
+            )
+            try:
+                # Shielded: a timeout stops the wait, not the thread, which keeps the tab until it's done
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+                try:
+                    dumps_json(result)
+                except (TypeError, ValueError):
+                    result = str(result)
+                outcome.update(status="success", result=result)
+            except asyncio.TimeoutError:
+                outcome.update(status="timeout", message=f"No result within {timeout}s")
+            except Exception as e:
+                outcome.update(status="error", message=str(e))
+            outcome["seconds"] = round(time.perf_counter() - started, 3)
+            if data["tab_id"] in reserved:
+                await give_back(data)
+            return outcome
+
+        tasks = [asyncio.create_task(run_one(data)) for data in targets]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Tabs whose run was cancelled (client went away) still go back to the pool
+            for data in targets:
+                if data["tab_id"] in reserved:
+                    await give_back(data)
+            executor.shutdown(wait=False)
+
+    # --- SESSION STATE ---
+
+    async def snapshot_session(self, tab_id: str, name: str, ttl: Optional[float] = None,
+                               all_cookies: bool = False) -> dict:
+        tab_data = self.tab_index.get(tab_id)
+        if not tab_data:
+            return {"status": "error", "message": f"Tab {tab_id} not found in pool."}
+        try:
+            state = await asyncio.to_thread(capture_session, tab_data["obj"], all_cookies)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "session": self.sessions.put(name, state, ttl)}
+
+    async def _apply_session(self, tab_data: dict, name: str):
+        snapshot = self.sessions.get(name)
+        if snapshot is None:
+            raise ValueError(f"Session '{name}' not found or expired.")
+        applied = await asyncio.to_thread(apply_session, tab_data["obj"], snapshot)
+        tab_data.setdefault("session_applied", []).append(applied)
+        in_use = self.session_cookies.setdefault(tab_data["port"], {})
+        for key in applied["cookies"]:
+            in_use[key] = in_use.get(key, 0) + 1
+        if tab_data["tab_id"] in self.leased:
+            tab_data["session_used"] = True
+
+    async def apply_session_to_tabs(self, name: str, targets: List[dict]) -> dict:
+        """Injects a snapshot into every target tab at once, ahead of their next navigation."""
+        if self.sessions.get(name) is None:
+            return {"status": "error", "message": f"Session '{name}' not found or expired."}
+
+        async def apply_one(tab_data: dict) -> Optional[str]:
+            try:
+                await self._apply_session(tab_data, name)
+                return None
+            except Exception as e:
+                return f"{tab_data['tab_id']}: {e}"
+
+        errors = [e for e in await asyncio.gather(*(apply_one(t) for t in targets)) if e]
+        return {"status": "success", "applied": len(targets) - len(errors), "errors": errors}
+
+    async def _clear_session(self, tab_data: dict):
+        """
+        Injected session state belongs to the lease that used it; the next lessee starts without it.
+        Restore scripts go at once, cookies once no other lease on the browser still uses them.
+        Returns that didn't end such a lease (e.g. a broadcast on an idle tab) leave it in place.
+        """
+        if not tab_data.pop("session_used", False):
+            return
+        script_ids, cookies = [], []
+        in_use = self.session_cookies.get(tab_data["port"], {})
+        for applied in tab_data.pop("session_applied", []):
+            if applied["script_id"]:
+                script_ids.append(applied["script_id"])
+            for key in applied["cookies"]:
+                in_use[key] = in_use.get(key, 1) - 1
+                if in_use[key] <= 0:
+                    del in_use[key]
+                    cookies.append(key)
+        try:
+            await asyncio.to_thread(remove_session, tab_data["obj"], script_ids, cookies)
+        except Exception as e:
+            print(f"⚠️ [Session] Could not remove session state on tab {tab_data['tab_id']}: {e}")
+
+    # --- NETWORK RECORDING ---
+
+    async def start_recording(self, tab_id: str, include_bodies: bool = True) -> dict:
+        tab_data = self.tab_index.get(tab_id)
+        if not tab_data:
+            return {"status": "error", "message": f"Tab {tab_id} not found in pool."}
+        if self._is_recording(tab_id):
+            return {"status": "error", "message": f"Tab {tab_id} is already being recorded."}
+
+        recorder = NetworkRecorder(tab_data["obj"], tab_id, include_bodies=include_bodies)
+        try:
+            await asyncio.to_thread(recorder.start)
+        except Exception as e:
+            return {"status": "error", "message": f"Recording failed to start: {e}"}
+        self.recordings[recorder.id] = recorder
+        return {"status": "success", "recording_id": recorder.id, "tab_id": tab_id}
+
+    async def stop_recording(self, recording_id: str) -> dict:
+        recorder = self.recordings.get(recording_id)
+        if not recorder:
+            return {"status": "error", "message": f"Recording {recording_id} not found."}
+        if recorder.state == "recording":
+            await asyncio.to_thread(recorder.stop)
+            await self.prune_recordings()
+        return {"status": "success", **recorder.to_dict()}
+
+    def _is_recording(self, tab_id: str) -> bool:
+        return any(r.tab_id == tab_id and r.state == "recording" for r in self.recordings.values())
+
+    async def delete_recording(self, recording_id: str) -> bool:
+        recorder = self.recordings.pop(recording_id, None)
+        if recorder is None:
+            return False
+        if recorder.state != "done":
+            # Also waits for a writer still finishing, so it isn't writing into a removed directory
+            await asyncio.to_thread(recorder.stop)
+        await asyncio.to_thread(shutil.rmtree, recorder.directory, True)
+        return True
+
+    async def prune_recordings(self):
+        """Keeps at most MAX_RECORDINGS finished recordings, dropping the oldest archives first."""
+        finished = sorted((r for r in self.recordings.values() if r.state == "done"), key=lambda r: r.finished_at)
+        for recorder in finished[:max(0, len(finished) - self.MAX_RECORDINGS)]:
+            await self.delete_recording(recorder.id)
+
+    def load_recordings(self):
+        """Picks up finished recordings left on disk by a previous run; incomplete archives are removed."""
+        if not os.path.isdir(RECORDINGS_DIR):
+            return
+        for name in os.listdir(RECORDINGS_DIR):
+            directory = os.path.join(RECORDINGS_DIR, name)
+            recorder = NetworkRecorder.load(directory)
+            if recorder is None:
+                # Cut off mid-recording: its last segment and meta can't be trusted
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            self.recordings[recorder.id] = recorder
+
+    # --- RESPONSE CACHE ---
+
+    async def set_cache_mode(self, mode: str, max_mb: Optional[int] = None) -> dict:
+        """Switches every tab to a new cache mode (off / shared / record / replay)."""
+        if mode not in CACHE_MODES:
+            return {"status": "error", "message": f"Unknown cache mode '{mode}'. Use one of {list(CACHE_MODES)}."}
+
+        tabs = [data["obj"] for data in self.tab_index.values()]
+
+        def reattach():
+            for tab_obj in tabs:
+                self.cache_interceptor.detach(tab_obj)
+            self.cache.mode = mode
+            if max_mb is not None:
+                self.cache.max_bytes = max_mb * 1024 * 1024
+            for tab_obj in tabs:
+                self.cache_interceptor.attach(tab_obj)
+
+        try:
+            await asyncio.to_thread(reattach)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "cache": self.cache.report(), "tabs": len(self.cache_interceptor.attached)}
+
+    # --- TAB & BROWSER RECYCLING ---
+
+    @staticmethod
+    def _open_warm_tab(page: ChromiumPage):
+        """Opens a tab and makes sure its renderer is up before it is pooled."""
+        new_tab = page.new_tab()
+        new_tab.run_js("return document.readyState")
+        return new_tab
+
+    @staticmethod
+    def _new_tab_data(port_str: str, tab_obj) -> dict:
+        """The pool entry for a tab; every tab, launched or recycled, is built here."""
+        return {"port": port_str, "obj": tab_obj, "tab_id": tab_obj.tab_id, "tags": set()}
+
+    async def _add_tab(self, port_str: str, tab_obj, tags: Optional[set] = None) -> dict:
+        await asyncio.to_thread(self.cache_interceptor.attach, tab_obj)
+        tab_data = self._new_tab_data(port_str, tab_obj)
+        tab_data["tags"].update(tags or ())
+        self.tab_index[tab_obj.tab_id] = tab_data
+        self.health.track_tab(tab_obj.tab_id, port_str)
+        add_registry_tab(port_str, tab_obj.tab_id)
+        await self.tab_pool.put(tab_data)
+        return tab_data
+
+    async def _return_tab(self, tab_data: dict):
+        """Puts a tab back into the pool, replacing it first if it has degraded."""
+        tab_id = tab_data["tab_id"]
+        port = tab_data["port"]
+        self.leased.discard(tab_id)
+        await self._drop_watches(tab_id)
+        await self._clear_session(tab_data)
+
+        # Invalidated by a kill operation
+        if tab_id not in self.tab_index:
+            self.tab_pool.forget(tab_id)
+            return
+
+        if port in self.draining:
+            await self._retire_tab(tab_data)
+            return
+
+        if self.health.tab_needs_recycle(tab_id):
+            await self.recycle_tab(tab_data)
+        else:
+            await self.tab_pool.put(tab_data)
+            update_registry(port, tab_id, "idle", "about:blank")
+
+        if self.health.browser_needs_recycle(port):
+            self._schedule_browser_recycle(port)
+
+    async def _retire_tab(self, tab_data: dict):
+        """Removes a tab from the pool for good and closes it."""
+        tab_id = tab_data["tab_id"]
+        port = tab_data["port"]
+        self.tab_index.pop(tab_id, None)
+        self.leased.discard(tab_id)
+        self.tab_pool.forget(tab_id)
+        self.cache_interceptor.attached.discard(tab_id)
+        await self._drop_watches(tab_id)
+        self.health.forget_tab(tab_id)
+        remove_registry_tab(port, tab_id)
+        try:
+            await asyncio.to_thread(tab_data["obj"].close)
+        except Exception as e:
+            print(f"⚠️ [Health] Could not close tab {tab_id}: {e}")
+
+        # Last tab of a draining browser gone: the browser can go too
+        if port in self.draining and not any(d["port"] == port for d in self.tab_index.values()):
+            self.kill(int(port))
+
+    async def recycle_tab(self, tab_data: dict):
+        """Replaces a degraded tab with a fresh one on the same browser."""
+        port = tab_data["port"]
+        try:
+            page = self.get_browser(int(port))
+            new_tab = await asyncio.to_thread(self._open_warm_tab, page)
+            # The replacement keeps the old tab's tags so tag-targeted broadcasts still reach it
+            await self._add_tab(port, new_tab, tab_data["tags"])
+        except Exception as e:
+            # Keep serving with the old tab rather than shrinking the pool
+            print(f"⚠️ [Health] Tab recycle failed on Port {port}: {e}")
+            await self.tab_pool.put(tab_data)
+            update_registry(port, tab_data["tab_id"], "idle", "about:blank")
+            return
+
+        print(f"♻️ [Health] Recycled tab {tab_data['tab_id']} -> {new_tab.tab_id} on Port {port}")
+        self.health.recycled["tabs"] += 1
+        await self._retire_tab(tab_data)
+
+    def _schedule_browser_recycle(self, port: str):
+        if port not in self.draining:
+            asyncio.create_task(self.recycle_browser(port))
+
+    async def recycle_browser(self, port: str) -> dict:
+        """
+        Replaces a browser with a fresh process.
+        The replacement and its tabs are warmed and pooled first; the old
+        browser's idle tabs are then retired and its leased tabs are retired
+        as they come back. The old process is killed once empty, or after
+        BROWSER_DRAIN_TIMEOUT at the latest.
+        """
+        port = str(port)
+        if port in self.draining:
+            return {"status": "error", "message": f"Port {port} is already being recycled."}
+        self.draining.add(port)
+
+        old_tabs = [d for d in self.tab_index.values() if d["port"] == port]
+        profile = load_registry().get(port, {}).get("profile", "default")
+        result = await asyncio.to_thread(self.launch, find_free_port(), True, profile)
+        if result["status"] == "error":
+            self.draining.discard(port)
+            return result
+
+        new_port = str(result["port"])
+        try:
+            page = self.get_browser(int(new_port))
+            for _ in range(max(1, len(old_tabs))):
+                new_tab = await asyncio.to_thread(self._open_warm_tab, page)
+                await self._add_tab(new_port, new_tab)
+        except Exception as e:
+            print(f"⚠️ [Health] Warm-up of replacement Port {new_port} failed: {e}")
+
+        print(f"♻️ [Health] Recycling browser Port {port} -> Port {new_port}")
+        self.health.recycled["browsers"] += 1
+
+        for tab_data in old_tabs:
+            if tab_data["tab_id"] not in self.leased:
+                await self._retire_tab(tab_data)
+
+        if port in self.draining:
+            asyncio.create_task(self._drain_deadline(port))
+
+        return {"status": "success", "old_port": int(port), "new_port": int(new_port)}
+
+    async def _drain_deadline(self, port: str):
+        await asyncio.sleep(self.BROWSER_DRAIN_TIMEOUT)
+        if port in self.draining:
+            print(f"⏱️ [Health] Port {port} still had leased tabs after drain timeout, killing.")
+            self.kill(int(port))
+
+    async def health_loop(self, interval: float = 30.0):
+        """Background check for browsers that grew past their limits while idle."""
+        while True:
+            await asyncio.sleep(interval)
+            for port in list(self.health.browsers):
+                if port in self.draining:
+                    continue
+                try:
+                    if await asyncio.to_thread(self.health.browser_needs_recycle, port):
+                        self._schedule_browser_recycle(port)
+                except Exception as e:
+                    print(f"⚠️ [Health] Check failed for Port {port}: {e}")
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import uuid
+import shutil
+import tempfile
+from typing import Optional
+from DrissionPage import ChromiumOptions
+# Python file imports
+from utils import process_tree_rss
+
+# Shared memory is RAM-backed on Linux: a cloned profile starts without touching disk
+TMPFS_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# A prepared user-data dir (first-run done, settings tuned) to clone for each new browser
+PROFILE_TEMPLATE = os.environ.get("CRAWLGRID_PROFILE_TEMPLATE")
+
+# Flags that strip what a crawler never uses
+LEAN_ARGUMENTS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-breakpad",
+    "--disable-domain-reliability",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,BackForwardCache",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--password-store=basic",
+    # Pooled tabs sit in the background; keep them from being throttled
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+
+LAUNCH_PROFILES = {
+    "default": {
+        "description": "Headed browser with Chromium defaults (previous behaviour)."
+    },
+    "headless": {
+        "description": "Default browser without a window.",
+        "headless": True
+    },
+    "lean": {
+        "description": "Headless, GPU/extensions/background services off, renderer processes capped.",
+        "headless": True,
+        "arguments": LEAN_ARGUMENTS,
+        "renderer_process_limit": 4,
+        "tmpfs": True
+    },
+    "lean-noimg": {
+        "description": "lean, without downloading images.",
+        "headless": True,
+        "arguments": LEAN_ARGUMENTS + ["--blink-settings=imagesEnabled=false"],
+        "renderer_process_limit": 4,
+        "tmpfs": True
+    },
+}
+
+
+def prepare_user_data_dir(port: int, profile: dict) -> Optional[str]:
+    """Fresh per-browser user-data dir on tmpfs, cloned from the template when one is set."""
+    if not profile.get("tmpfs"):
+        return None
+    path = os.path.join(TMPFS_DIR, f"crawlgrid-{port}-{uuid.uuid4().hex[:8]}")
+    if PROFILE_TEMPLATE and os.path.isdir(PROFILE_TEMPLATE):
+        # Locks from the template's last run would make Chromium refuse the copy
+        shutil.copytree(PROFILE_TEMPLATE, path, ignore=shutil.ignore_patterns("Singleton*", "*.lock"))
+    else:
+        os.makedirs(path)
+    return path
+
+
+def build_options(profile_name: str, port: Optional[int], user_data_dir: Optional[str]) -> ChromiumOptions:
+    profile = LAUNCH_PROFILES[profile_name]
+    co = ChromiumOptions()
+    if port is not None:
+        co.set_local_port(port)
+    if profile.get("headless"):
+        co.headless(True)
+    for argument in profile.get("arguments", []):
+        name, _, value = argument.partition("=")
+        co.set_argument(name, value or None)
+    if profile.get("renderer_process_limit"):
+        co.set_argument("--renderer-process-limit", str(profile["renderer_process_limit"]))
+    if user_data_dir:
+        co.set_user_data_path(user_data_dir)
+    return co
+
+
+class ProfileStats:
+    """Launch time per profile; RSS is sampled live from the browsers still running."""
+    def __init__(self):
+        self.launches = {}
+
+    def record_launch(self, profile_name: str, seconds: float):
+        stats = self.launches.setdefault(profile_name, {"launches": 0, "total_seconds": 0.0, "last_seconds": 0.0})
+        stats["launches"] += 1
+        stats["total_seconds"] += seconds
+        stats["last_seconds"] = seconds
+
+    def report(self, registry: dict) -> dict:
+        report = {}
+        for name, profile in LAUNCH_PROFILES.items():
+            launches = self.launches.get(name, {"launches": 0, "total_seconds": 0.0, "last_seconds": 0.0})
+            running = [data for data in registry.values() if data.get("profile", "default") == name]
+            rss = [process_tree_rss(data["process_id"]) for data in running]
+            report[name] = {
+                "description": profile["description"],
+                "launches": launches["launches"],
+                "avg_launch_seconds": round(launches["total_seconds"] / launches["launches"], 3) if launches["launches"] else None,
+                "last_launch_seconds": round(launches["last_seconds"], 3) if launches["launches"] else None,
+                "running": len(running),
+                "avg_rss_mb": round(sum(rss) / len(rss) / (1024 * 1024), 1) if rss else None,
+                "total_rss_mb": round(sum(rss) / (1024 * 1024), 1)
+            }
+        return report
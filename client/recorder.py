@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import queue
+import base64
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+# Python file imports
+from jobs import SegmentWriter, iter_segments
+
+RECORDINGS_DIR = os.environ.get("CRAWLGRID_RECORDINGS_DIR", "recordings")
+NETWORK_EVENTS = ("Network.requestWillBeSent", "Network.responseReceived",
+                  "Network.loadingFinished", "Network.loadingFailed")
+
+
+def _har_headers(headers: dict) -> list:
+    return [{"name": k, "value": str(v)} for k, v in (headers or {}).items()]
+
+
+class NetworkRecorder:
+    """
+    Records a tab's network activity straight to disk.
+    CDP Network events are only queued on DrissionPage's event thread; a writer
+    thread assembles HAR entries, stores response bodies out-of-line under
+    bodies/<sha256> (deduplicated) and appends entries to rotating gzip NDJSON
+    segments. Nothing is serialized for a live client while recording.
+    """
+    def __init__(self, tab_obj, tab_id: str, root: str = RECORDINGS_DIR, include_bodies: bool = True,
+                 max_body_bytes: int = 20 * 1024 * 1024, max_pending: int = 10000):
+        self.id = uuid.uuid4().hex[:12]
+        self.tab_obj = tab_obj
+        self.tab_id = tab_id
+        self.directory = os.path.join(root, self.id)
+        self.bodies_dir = os.path.join(self.directory, "bodies")
+        self.include_bodies = include_bodies
+        self.max_body_bytes = max_body_bytes
+        self.writer = SegmentWriter(self.directory, prefix="har", records_per_segment=2000)
+        self.state = "recording"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stats = {"entries": 0, "failed": 0, "bodies": 0, "body_bytes": 0, "dropped_events": 0}
+        # Bounded so a burst of traffic can't grow memory without limit; overflow is counted
+        self._events = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{self.id}", daemon=True)
+        os.makedirs(self.bodies_dir, exist_ok=True)
+
+    # --- LIFECYCLE ---
+
+    def start(self):
+        self._thread.start()
+        for event in NETWORK_EVENTS:
+            self.tab_obj.driver.set_callback(event, self._make_handler(event))
+        self.tab_obj.run_cdp("Network.enable")
+        self._save_meta()
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["NetworkRecorder"]:
+        """A finished recording left on disk by a previous run, readable again; None if it never finished."""
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get("state") != "done":
+            return None
+        recorder = cls.__new__(cls)
+        recorder.id = meta["recording_id"]
+        recorder.tab_obj = None
+        recorder.tab_id = meta.get("tab_id")
+        recorder.directory = directory
+        recorder.bodies_dir = os.path.join(directory, "bodies")
+        recorder.writer = SegmentWriter(directory, prefix="har")
+        recorder.writer.segments = meta.get("segment_index", [])
+        recorder.writer.records = recorder.writer.published
+        recorder.state = "done"
+        recorder.started_at = meta.get("started_at")
+        recorder.finished_at = meta.get("finished_at")
+        recorder.stats = {k: meta.get(k, 0) for k in ("entries", "failed", "bodies", "body_bytes", "dropped_events")}
+        recorder._events = queue.Queue()
+        recorder._thread = None
+        return recorder
+
+    def stop(self):
+        """
+        Detaches from the tab and waits for the writer to drain queued events and
+        close the last segment. If that takes longer than the wait, the state stays
+        "finishing" and the writer marks the recording done when it gets there.
+        """
+        if self.state == "recording":
+            self.state = "finishing"
+            for event in NETWORK_EVENTS:
+                self.tab_obj.driver.set_callback(event, None)
+            self._events.put(None)
+        self._thread.join(timeout=30)
+
+    def _make_handler(self, event: str):
+        def handler(**params):
+            try:
+                self._events.put_nowait((event, params))
+            except queue.Full:
+                self.stats["dropped_events"] += 1
+        return handler
+
+    # --- WRITER THREAD ---
+
+    def _run(self):
+        while True:
+            item = self._events.get()
+            if item is None:
+                break
+            event, params = item
+            try:
+                self._handle(event, params)
+            except Exception as e:
+                print(f"⚠️ [Recorder] {event} handling failed: {e}")
+            self.writer.rotate_if_stale()
+        try:
+            # Whatever never finished loading is still worth keeping
+            for request_id in list(self._pending):
+                self._write_entry(self._pending.pop(request_id), None)
+            self.writer.rotate()
+            # Only now: disabling the domain drops the response bodies queued entries still fetch
+            self.tab_obj.run_cdp("Network.disable")
+        except Exception as e:
+            print(f"⚠️ [Recorder] Closing recording {self.id} incomplete: {e}")
+        finally:
+            self.state = "done"
+            self.finished_at = time.time()
+            self._save_meta()
+
+    def _handle(self, event: str, params: dict):
+        request_id = params.get("requestId")
+        if event == "Network.requestWillBeSent":
+            # A redirect reuses the requestId: close the previous hop first
+            if request_id in self._pending and params.get("redirectResponse"):
+                entry = self._pending.pop(request_id)
+                self._add_response(entry, params["redirectResponse"])
+                self._write_entry(entry, None)
+            request = params["request"]
+            self._pending[request_id] = {
+                "startedDateTime": datetime.fromtimestamp(params.get("wallTime", time.time()), timezone.utc).isoformat(),
+                "_monotonic": params.get("timestamp"),
+                "_resourceType": params.get("type"),
+                "request": {
+                    "method": request.get("method"),
+                    "url": request.get("url"),
+                    "httpVersion": "",
+                    "headers": _har_headers(request.get("headers")),
+                    "postData": {"text": request["postData"]} if request.get("postData") else None
+                },
+                "response": None
+            }
+        elif event == "Network.responseReceived":
+            entry = self._pending.get(request_id)
+            if entry is not None:
+                self._add_response(entry, params["response"])
+        elif event == "Network.loadingFinished":
+            entry = self._pending.pop(request_id, None)
+            if entry is not None:
+                entry["_finished"] = params.get("timestamp")
+                entry["_encodedDataLength"] = params.get("encodedDataLength")
+                self._write_entry(entry, request_id)
+        elif event == "Network.loadingFailed":
+            entry = self._pending.pop(request_id, None)
+            if entry is not None:
+                entry["_finished"] = params.get("timestamp")
+                entry["_error"] = params.get("errorText")
+                self.stats["failed"] += 1
+                self._write_entry(entry, None)
+
+    @staticmethod
+    def _add_response(entry: dict, response: dict):
+        entry["response"] = {
+            "status": response.get("status"),
+            "statusText": response.get("statusText", ""),
+            "httpVersion": response.get("protocol", ""),
+            "headers": _har_headers(response.get("headers")),
+            "content": {"mimeType": response.get("mimeType", ""), "size": 0},
+            "redirectURL": response.get("headers", {}).get("location", "")
+        }
+        entry["request"]["httpVersion"] = response.get("protocol", "")
+        entry["serverIPAddress"] = response.get("remoteIPAddress")
+
+    def _store_body(self, request_id: str, content: dict):
+        result = self.tab_obj.run_cdp("Network.getResponseBody", requestId=request_id)
+        body = result.get("body", "")
+        raw = base64.b64decode(body) if result.get("base64Encoded") else body.encode("utf-8")
+        content["size"] = len(raw)
+        if len(raw) > self.max_body_bytes:
+            content["_truncated"] = True
+            return
+        digest = hashlib.sha256(raw).hexdigest()
+        path = os.path.join(self.bodies_dir, digest)
+        # Content-addressed: the same script/image across pages is written once
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(raw)
+            self.stats["bodies"] += 1
+            self.stats["body_bytes"] += len(raw)
+        content["_file"] = f"bodies/{digest}"
+
+    def _write_entry(self, entry: dict, request_id: Optional[str]):
+        started, finished = entry.pop("_monotonic", None), entry.pop("_finished", None)
+        entry["time"] = round((finished - started) * 1000, 3) if started and finished else -1
+        entry["cache"] = {}
+        entry["timings"] = {"send": 0, "wait": max(entry["time"], 0), "receive": 0}
+        if entry["response"] is None:
+            entry["response"] = {"status": 0, "statusText": "", "httpVersion": "", "headers": [],
+                                 "content": {"mimeType": "", "size": 0}, "redirectURL": ""}
+        elif request_id and self.include_bodies:
+            try:
+                self._store_body(request_id, entry["response"]["content"])
+            except Exception:
+                entry["response"]["content"]["_unavailable"] = True
+        if entry["request"].get("postData") is None:
+            entry["request"].pop("postData", None)
+        self.writer.write(entry)
+        self.stats["entries"] += 1
+
+    # --- READING BACK ---
+
+    def _save_meta(self):
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({**self.to_dict(), "segment_index": self.writer.segments}, f)
+
+    async def entries(self, offset: int = 0):
+        """NDJSON HAR entries from `offset` on (closed segments only)."""
+        async for line in iter_segments(self.directory, self.writer.segments, offset):
+            yield line
+
+    async def har_chunks(self):
+        """The recording as one HAR 1.2 document, streamed entry by entry."""
+        yield b'{"log":{"version":"1.2","creator":{"name":"crawlgrid","version":"1.0"},"entries":['
+        first = True
+        async for line in iter_segments(self.directory, self.writer.segments):
+            yield (b"" if first else b",") + line.rstrip(b"\n")
+            first = False
+        yield b"]}}"
+
+    def body_path(self, digest: str) -> Optional[str]:
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        path = os.path.join(self.bodies_dir, digest)
+        return path if os.path.exists(path) else None
+
+    def segment_path(self, n: int) -> Optional[str]:
+        if 0 <= n < len(self.writer.segments):
+            return os.path.join(self.directory, self.writer.segments[n]["name"])
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "recording_id": self.id,
+            "tab_id": self.tab_id,
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "segments": len(self.writer.segments),
+            "readable_entries": self.writer.published,
+            "queued_events": self._events.qsize(),
+            **self.stats
+        }
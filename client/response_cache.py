@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+CACHE_DIR = os.environ.get("CRAWLGRID_CACHE_DIR", "response_cache")
+CACHE_MODES = ("off", "shared", "record", "replay")
+# Subresources worth sharing between browsers in "shared" mode; documents stay live
+SHARED_RESOURCE_TYPES = ("Script", "Stylesheet", "Image", "Font", "Media", "XHR", "Fetch")
+# The body we get back from CDP is already decoded, so these no longer describe it
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+DEFAULT_TTL = 3600
+
+
+def _cache_key(method: str, url: str) -> str:
+    return hashlib.sha1(f"{method} {url}".encode("utf-8")).hexdigest()
+
+
+def _ttl_from_headers(headers: dict) -> Optional[float]:
+    """Seconds the response may be reused, 0 if it must not be, None if it doesn't say."""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "private" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"(?:s-maxage|max-age)=(\d+)", cache_control)
+    if match:
+        return float(match.group(1))
+    if headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0    # an invalid Expires means already expired
+        return max(0.0, expires - time.time())
+    return None
+
+
+def _varies(headers: dict) -> bool:
+    """True if the response depends on request headers that are not part of the cache key."""
+    # CDP hands back decoded bodies, so Accept-Encoding variants are all the same
+    fields = {f.strip().lower() for f in headers.get("vary", "").split(",") if f.strip()}
+    return bool(fields - {"accept-encoding"})
+
+
+class ResponseCache:
+    """
+    Node-wide on-disk response store with size-bounded LRU eviction.
+    Shared by every tab on the node; safe to call from DrissionPage's event threads.
+    Modes:
+      off     - not used
+      shared  - subresources with explicit freshness (Cache-Control/Expires) are stored and served
+      record  - every response is stored, regardless of cache headers
+      replay  - everything is served from the store; misses fail instead of going to the network
+    """
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = 2 * 1024 ** 3, mode: str = "off"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.index = OrderedDict()   # key -> size in bytes, oldest first
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "replay_misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    # --- STORAGE ---
+
+    def _paths(self, key: str):
+        directory = os.path.join(self.root, key[:2])
+        return os.path.join(directory, key + ".meta"), os.path.join(directory, key + ".body")
+
+    def _load_index(self):
+        """Rebuilds the LRU order from disk, least recently used (oldest mtime) first."""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".body"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+            self.total_bytes += size
+
+    def get(self, url: str, method: str = "GET") -> Optional[tuple]:
+        """Returns (meta, body) for a usable entry, or None."""
+        key = _cache_key(method, url)
+        with self._lock:
+            if key not in self.index:
+                self.stats["misses"] += 1
+                return None
+        # Files are read without the lock so one large body doesn't stall every tab's lookups
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            # Replay serves whatever was recorded; shared mode honours expiry
+            expired = self.mode != "replay" and meta.get("expires") and meta["expires"] < time.time()
+            if not expired:
+                with open(body_path, "rb") as f:
+                    body = f.read()
+                os.utime(body_path)
+        except (OSError, json.JSONDecodeError):
+            expired = True
+        with self._lock:
+            if expired:
+                self._remove(key)
+                self.stats["misses"] += 1
+                return None
+            if key in self.index:
+                self.index.move_to_end(key)
+            self.stats["hits"] += 1
+        return meta, body
+
+    def should_store(self, status: int, headers: dict, resource_type: str,
+                     request_headers: Optional[dict] = None) -> bool:
+        if self.mode == "record":
+            return True
+        if self.mode != "shared" or status != 200 or resource_type not in SHARED_RESOURCE_TYPES:
+            return False
+        if "set-cookie" in headers or _varies(headers):
+            return False
+        cache_control = headers.get("cache-control", "").lower()
+        # A credentialed request is per-user unless the response says it may be shared
+        credentialed = request_headers and ("authorization" in request_headers or "cookie" in request_headers)
+        if credentialed and "public" not in cache_control and "s-maxage" not in cache_control:
+            return False
+        # Only responses that say how long they stay fresh; guessing would serve stale API data
+        return bool(_ttl_from_headers(headers))
+
+    def put(self, url: str, status: int, headers: dict, body: bytes, method: str = "GET"):
+        if len(body) > self.max_bytes // 10:
+            return  # one entry must never flush most of the cache
+        ttl = _ttl_from_headers(headers)
+        meta = {
+            "url": url,
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k not in DROPPED_HEADERS},
+            "stored_at": time.time(),
+            "expires": time.time() + (ttl if ttl else DEFAULT_TTL)
+        }
+        key = _cache_key(method, url)
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            with open(body_path, "wb") as f:
+                f.write(body)
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+            self.total_bytes += len(body) - self.index.get(key, 0)
+            self.index[key] = len(body)
+            self.index.move_to_end(key)
+            self.stats["stores"] += 1
+            while self.total_bytes > self.max_bytes and self.index:
+                self._remove(next(iter(self.index)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        self.total_bytes -= self.index.pop(key, 0)
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self.index):
+                self._remove(key)
+
+    def report(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "mode": self.mode,
+            "entries": len(self.index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
+
+
+class CacheInterceptor:
+    """
+    Wires a ResponseCache into tabs through CDP's Fetch domain.
+    Requests are paused before they hit the network (served from the cache on a hit)
+    and again when the response arrives (stored if cacheable).
+    """
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+        self.attached = set()
+
+    def _patterns(self) -> list:
+        if self.cache.mode == "shared":
+            types = SHARED_RESOURCE_TYPES
+            return [{"urlPattern": "*", "resourceType": t, "requestStage": stage}
+                    for t in types for stage in ("Request", "Response")]
+        return [{"urlPattern": "*", "requestStage": "Request"}, {"urlPattern": "*", "requestStage": "Response"}]
+
+    def attach(self, tab_obj):
+        if self.cache.mode == "off":
+            return
+        tab_obj.driver.set_callback("Fetch.requestPaused", lambda **event: self._on_paused(tab_obj, event))
+        tab_obj.run_cdp("Fetch.enable", patterns=self._patterns())
+        self.attached.add(tab_obj.tab_id)
+
+    def detach(self, tab_obj):
+        if tab_obj.tab_id not in self.attached:
+            return
+        tab_obj.run_cdp("Fetch.disable")
+        tab_obj.driver.set_callback("Fetch.requestPaused", None)
+        self.attached.discard(tab_obj.tab_id)
+
+    def _on_paused(self, tab_obj, event: dict):
+        request_id = event["requestId"]
+        try:
+            if "responseStatusCode" in event or "responseErrorReason" in event:
+                self._on_response(tab_obj, event)
+            else:
+                self._on_request(tab_obj, event)
+        except Exception as e:
+            print(f"⚠️ [Cache] Interception error on {event.get('request', {}).get('url')}: {e}")
+            try:
+                tab_obj.run_cdp("Fetch.continueRequest", requestId=request_id)
+            except Exception:
+                pass
+
+    def _on_request(self, tab_obj, event: dict):
+        request = event["request"]
+        request_id = event["requestId"]
+        hit = self.cache.get(request["url"]) if request["method"] == "GET" else None
+
+        if hit is not None:
+            meta, body = hit
+            tab_obj.run_cdp(
+                "Fetch.fulfillRequest",
+                requestId=request_id,
+                responseCode=meta["status"],
+                responseHeaders=[{"name": k, "value": v} for k, v in meta["headers"].items()],
+                body=base64.b64encode(body).decode("ascii")
+            )
+        elif self.cache.mode == "replay":
+            self.cache.stats["replay_misses"] += 1
+            tab_obj.run_cdp("Fetch.failRequest", requestId=request_id, errorReason="InternetDisconnected")
+        else:
+            tab_obj.run_cdp("Fetch.continueRequest", requestId=request_id)
+
+    def _on_response(self, tab_obj, event: dict):
+        request_id = event["requestId"]
+        status = event.get("responseStatusCode")
+        headers = {h["name"].lower(): h["value"] for h in event.get("responseHeaders", [])}
+        request = event["request"]
+        request_headers = {k.lower(): v for k, v in request.get("headers", {}).items()}
+
+        # Redirects have no body to fetch; errors have no response at all
+        if (status and not 300 <= status < 400 and request["method"] == "GET"
+                and self.cache.should_store(status, headers, event.get("resourceType", ""), request_headers)):
+            result = tab_obj.run_cdp("Fetch.getResponseBody", requestId=request_id)
+            body = result.get("body", "")
+            raw = base64.b64decode(body) if result.get("base64Encoded") else body.encode("utf-8")
+            self.cache.put(request["url"], status, headers, raw)
+
+        tab_obj.run_cdp("Fetch.continueRequest", requestId=request_id)
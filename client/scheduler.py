@@ -0,0 +1,388 @@
+import time
+import asyncio
+from collections import deque, defaultdict, OrderedDict
+from typing import Optional, Callable
+
+# Lower value is served first. Bulk work only gets tabs nobody more urgent is waiting for.
+PRIORITY_CLASSES = {"interactive": 0, "default": 1, "bulk": 2}
+DEFAULT_TENANT = "default"
+# How many origins we remember browser affinity for (LRU)
+MAX_TRACKED_ORIGINS = 10000
+
+
+class DomainPolicy:
+    """Per-host limits: concurrent leases and a token-bucket request rate."""
+    def __init__(self, max_concurrency: Optional[int] = None, rate: Optional[float] = None, burst: int = 1):
+        self.max_concurrency = max_concurrency
+        self.rate = rate            # requests per second, None = unlimited
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+
+    def refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def seconds_until_token(self) -> float:
+        if not self.rate or self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def to_dict(self) -> dict:
+        return {"max_concurrency": self.max_concurrency, "rate": self.rate, "burst": self.burst}
+
+
+class WaitStats:
+    """Wait-time distribution for one priority class."""
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def to_dict(self) -> dict:
+        return {
+            "served": self.count,
+            "avg_wait": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50_wait": round(self.percentile(50), 4),
+            "p95_wait": round(self.percentile(95), 4),
+            "p99_wait": round(self.percentile(99), 4),
+            "max_wait": round(self.max, 4)
+        }
+
+
+class AffinityStats:
+    """How often a request landed on a tab (or browser) that had already served its origin."""
+    def __init__(self):
+        self.tab_hits = 0
+        self.browser_hits = 0
+        self.misses = 0
+        self.deferred = 0
+
+    def to_dict(self) -> dict:
+        total = self.tab_hits + self.browser_hits + self.misses
+        return {
+            "tab_hits": self.tab_hits,
+            "browser_hits": self.browser_hits,
+            "misses": self.misses,
+            "deferred": self.deferred,
+            "tab_hit_rate": round(self.tab_hits / total, 4) if total else 0.0,
+            "warm_hit_rate": round((self.tab_hits + self.browser_hits) / total, 4) if total else 0.0
+        }
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "domain", "tenant", "origin", "enqueued_at", "deferred")
+
+    def __init__(self, future, priority: str, domain: Optional[str], tenant: str, origin: Optional[str]):
+        self.future = future
+        self.priority = priority
+        self.domain = domain
+        self.tenant = tenant
+        self.origin = origin
+        self.enqueued_at = time.monotonic()
+        self.deferred = False
+
+
+class TabScheduler:
+    """
+    Hands idle tabs to waiting requests.
+    Drop-in replacement for the old asyncio.Queue tab pool (put/get/qsize), with:
+      - strict priority between classes (interactive > default > bulk)
+      - weighted fair sharing between tenants inside a class
+      - per-domain concurrency caps and rate limits
+      - origin affinity: prefer an idle tab, then a browser, that recently served the origin
+    A lease holds its domain slot until the tab is put back or forgotten.
+    """
+    def __init__(self, is_valid: Optional[Callable[[dict], bool]] = None,
+                 default_max_concurrency: Optional[int] = None,
+                 affinity_wait: float = 0.25):
+        self.is_valid = is_valid or (lambda tab_data: True)
+        self.default_max_concurrency = default_max_concurrency
+        # How long a request may hold out for a warm tab while one is busy elsewhere
+        self.affinity_wait = affinity_wait
+        self._idle = deque()
+        # class -> tenant -> FIFO of waiters
+        self._waiters = {cls: defaultdict(deque) for cls in PRIORITY_CLASSES}
+        # Weighted fair share: a tenant's virtual time advances by 1/weight per lease
+        self._tenant_weights = {}
+        self._tenant_vtime = defaultdict(float)
+        self._domain_policies = {}
+        self._domain_active = defaultdict(int)
+        self._lease_domain = {}
+        self._wait_stats = {cls: WaitStats() for cls in PRIORITY_CLASSES}
+        self._retry_handle = None
+        self._retry_at = None
+        # Affinity state: last origin per tab, leased tabs per origin, recent browsers per origin
+        self._tab_origin = {}
+        self._lease_origin = {}
+        self._busy_origins = defaultdict(int)
+        self._origin_ports = OrderedDict()
+        self._affinity = AffinityStats()
+
+    # --- CONFIGURATION ---
+
+    def set_domain_policy(self, domain: str, max_concurrency: Optional[int] = None,
+                          rate: Optional[float] = None, burst: int = 1):
+        self._domain_policies[domain] = DomainPolicy(max_concurrency, rate, burst)
+        self._dispatch()
+
+    def set_tenant_weight(self, tenant: str, weight: float):
+        if weight <= 0:
+            raise ValueError("Tenant weight must be positive.")
+        self._tenant_weights[tenant] = weight
+
+    # --- QUEUE INTERFACE ---
+
+    def qsize(self) -> int:
+        """Number of idle tabs."""
+        return len(self._idle)
+
+    def waiting(self) -> int:
+        return sum(len(q) for tenants in self._waiters.values() for q in tenants.values())
+
+    async def put(self, tab_data: dict):
+        """Returns a tab to the pool, freeing the domain slot it was leased under."""
+        self._release_lease(tab_data["tab_id"])
+        self._idle.append(tab_data)
+        self._dispatch()
+
+    def take(self, tab_id: str) -> Optional[dict]:
+        """Removes a specific idle tab from the pool (no domain slot); None if it isn't idle."""
+        for tab_data in self._idle:
+            if tab_data["tab_id"] == tab_id:
+                self._idle.remove(tab_data)
+                return tab_data
+        return None
+
+    def forget(self, tab_id: str):
+        """Called when a leased tab is retired instead of being put back."""
+        self._release_lease(tab_id)
+        self._tab_origin.pop(tab_id, None)
+        self._dispatch()
+
+    async def get(self, priority: str = "default", domain: Optional[str] = None,
+                  tenant: Optional[str] = None, origin: Optional[str] = None) -> dict:
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{priority}'. Use one of {list(PRIORITY_CLASSES)}.")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, domain,
+                         tenant or DEFAULT_TENANT, origin)
+        self._enqueue(waiter)
+        self._dispatch()
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted and cancelled in the same tick: hand the tab back
+                await self.put(waiter.future.result())
+            raise
+
+    # --- SCHEDULING ---
+
+    def _enqueue(self, waiter: _Waiter):
+        tenants = self._waiters[waiter.priority]
+        if not tenants.get(waiter.tenant):
+            # A tenant that was idle re-joins at the current share, not with banked credit
+            active = [self._tenant_vtime[t] for t, q in tenants.items() if q]
+            floor = min(active) if active else self._tenant_vtime[waiter.tenant]
+            self._tenant_vtime[waiter.tenant] = max(self._tenant_vtime[waiter.tenant], floor)
+        tenants[waiter.tenant].append(waiter)
+
+    def _domain_delay(self, domain: Optional[str], now: float) -> Optional[float]:
+        """None if the domain is at its concurrency cap, else seconds until a rate token is free."""
+        if domain is None:
+            return 0.0
+        # Domains without an explicit policy share the default cap and keep no per-domain state
+        policy = self._domain_policies.get(domain)
+        cap = policy.max_concurrency if policy else self.default_max_concurrency
+        if cap is not None and self._domain_active.get(domain, 0) >= cap:
+            return None
+        if policy is None:
+            return 0.0
+        policy.refill(now)
+        return policy.seconds_until_token()
+
+    def _pick(self, now: float, skip: set, max_rank: int = len(PRIORITY_CLASSES)):
+        """
+        Returns (waiter, retry_in). retry_in is set when only rate limits held work back.
+        Classes ranked above max_rank are not considered.
+        """
+        retry_in = None
+        for cls in sorted(PRIORITY_CLASSES, key=PRIORITY_CLASSES.get):
+            if PRIORITY_CLASSES[cls] > max_rank:
+                break
+            tenants = self._waiters[cls]
+            for tenant in sorted((t for t, q in tenants.items() if q), key=lambda t: self._tenant_vtime[t]):
+                queue = tenants[tenant]
+                for waiter in list(queue):
+                    if waiter.future.done():
+                        queue.remove(waiter)
+                        continue
+                    if waiter in skip:
+                        continue
+                    delay = self._domain_delay(waiter.domain, now)
+                    if delay is None:
+                        continue
+                    if delay > 0:
+                        retry_in = delay if retry_in is None else min(retry_in, delay)
+                        continue
+                    queue.remove(waiter)
+                    if not queue:
+                        del tenants[tenant]
+                    return waiter, retry_in
+        return None, retry_in
+
+    def _take_tab(self, waiter: _Waiter, now: float):
+        """
+        Picks the warmest idle tab for the waiter.
+        Returns (tab_data, affinity) where affinity is "tab", "browser" or "miss".
+        (None, "defer") means a warm tab is busy and the waiter is still within affinity_wait;
+        (None, None) means the pool only held stale tabs.
+        """
+        warm_ports = self._origin_ports.get(waiter.origin, ()) if waiter.origin else ()
+        best, best_rank = None, 3
+        for tab_data in list(self._idle):
+            # Skip tabs invalidated by a kill or recycle while they sat idle
+            if not self.is_valid(tab_data):
+                self._idle.remove(tab_data)
+                self._tab_origin.pop(tab_data["tab_id"], None)
+                continue
+            if not waiter.origin:
+                best, best_rank = tab_data, 2
+                break
+            if self._tab_origin.get(tab_data["tab_id"]) == waiter.origin:
+                best, best_rank = tab_data, 0
+                break
+            rank = 1 if tab_data["port"] in warm_ports else 2
+            if rank < best_rank:
+                best, best_rank = tab_data, rank
+
+        if best is None:
+            return None, None
+        if (best_rank == 2 and waiter.origin and self._busy_origins.get(waiter.origin)
+                and now - waiter.enqueued_at < self.affinity_wait):
+            return None, "defer"
+
+        self._idle.remove(best)
+        return best, ("tab", "browser", "miss")[best_rank]
+
+    def _dispatch(self):
+        now = time.monotonic()
+        retry_in = None
+        skip = set()
+        # A waiter holding out for a warm tab still outranks lower classes
+        max_rank = len(PRIORITY_CLASSES)
+        while self._idle:
+            waiter, pick_retry = self._pick(now, skip, max_rank)
+            if pick_retry is not None:
+                retry_in = pick_retry if retry_in is None else min(retry_in, pick_retry)
+            if waiter is None:
+                break
+            tab_data, affinity = self._take_tab(waiter, now)
+            if tab_data is None:
+                # Keep the waiter at the head of its line
+                self._waiters[waiter.priority][waiter.tenant].appendleft(waiter)
+                if affinity != "defer":
+                    break
+                # Let its own class use the idle tabs meanwhile, and look again once the bound expires
+                if not waiter.deferred:
+                    waiter.deferred = True
+                    self._affinity.deferred += 1
+                skip.add(waiter)
+                max_rank = min(max_rank, PRIORITY_CLASSES[waiter.priority])
+                delay = self.affinity_wait - (now - waiter.enqueued_at)
+                retry_in = delay if retry_in is None else min(retry_in, delay)
+                continue
+            self._grant(waiter, tab_data, now, affinity)
+
+        if retry_in is not None:
+            self._schedule_retry(max(0.0, retry_in))
+
+    def _schedule_retry(self, delay: float):
+        loop = asyncio.get_running_loop()
+        retry_at = loop.time() + delay
+        if self._retry_handle is not None:
+            if self._retry_at <= retry_at:
+                return
+            self._retry_handle.cancel()
+        self._retry_at = retry_at
+        self._retry_handle = loop.call_at(retry_at, self._retry)
+
+    def _retry(self):
+        self._retry_handle = None
+        self._retry_at = None
+        self._dispatch()
+
+    def _grant(self, waiter: _Waiter, tab_data: dict, now: float, affinity: str):
+        tab_id = tab_data["tab_id"]
+        if waiter.origin:
+            if affinity == "tab":
+                self._affinity.tab_hits += 1
+            elif affinity == "browser":
+                self._affinity.browser_hits += 1
+            else:
+                self._affinity.misses += 1
+            self._tab_origin[tab_id] = waiter.origin
+            self._lease_origin[tab_id] = waiter.origin
+            self._busy_origins[waiter.origin] += 1
+            ports = self._origin_ports.setdefault(waiter.origin, OrderedDict())
+            self._origin_ports.move_to_end(waiter.origin)
+            ports[tab_data["port"]] = True
+            ports.move_to_end(tab_data["port"])
+            while len(self._origin_ports) > MAX_TRACKED_ORIGINS:
+                self._origin_ports.popitem(last=False)
+        if waiter.domain is not None:
+            policy = self._domain_policies.get(waiter.domain)
+            if policy and policy.rate:
+                policy.tokens -= 1
+            self._domain_active[waiter.domain] += 1
+            self._lease_domain[tab_id] = waiter.domain
+        self._tenant_vtime[waiter.tenant] += 1 / self._tenant_weights.get(waiter.tenant, 1.0)
+        self._wait_stats[waiter.priority].record(now - waiter.enqueued_at)
+        waiter.future.set_result(tab_data)
+
+    def _release_lease(self, tab_id: str):
+        origin = self._lease_origin.pop(tab_id, None)
+        if origin and self._busy_origins.get(origin):
+            self._busy_origins[origin] -= 1
+            if not self._busy_origins[origin]:
+                del self._busy_origins[origin]
+
+        domain = self._lease_domain.pop(tab_id, None)
+        if domain is not None:
+            self._domain_active[domain] = max(0, self._domain_active[domain] - 1)
+            if not self._domain_active[domain]:
+                del self._domain_active[domain]
+
+    # --- REPORTING ---
+
+    def stats(self) -> dict:
+        return {
+            "idle_tabs": self.qsize(),
+            "waiting": {
+                cls: {t: len(q) for t, q in tenants.items() if q}
+                for cls, tenants in self._waiters.items()
+            },
+            "wait_times": {cls: s.to_dict() for cls, s in self._wait_stats.items()},
+            "domains_active": dict(self._domain_active),
+            "domain_policies": {
+                d: p.to_dict() for d, p in self._domain_policies.items()
+            },
+            "default_max_concurrency": self.default_max_concurrency,
+            "tenant_weights": dict(self._tenant_weights),
+            "affinity": self._affinity.to_dict()
+        }
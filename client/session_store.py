@@ -0,0 +1,154 @@
+import json
+import time
+from typing import Optional
+
+# Reads the current origin's web storage
+CAPTURE_STORAGE_JS = """
+return JSON.stringify({
+    origin: location.origin,
+    local: Object.assign({}, window.localStorage),
+    session: Object.assign({}, window.sessionStorage)
+});
+"""
+
+# Runs at the start of every new document in the tab; restores the saved storage
+# the first time the tab lands on each saved origin after this apply, then leaves the page alone.
+# Does nothing once the snapshot has expired.
+RESTORE_STORAGE_JS = """
+(function (origins, marker, markerPrefix, expiresAt) {
+    const saved = origins[location.origin];
+    if (!saved || Date.now() / 1000 > expiresAt) return;
+    try {
+        if (sessionStorage.getItem(marker)) return;
+        for (const [k, v] of Object.entries(saved.local || {})) localStorage.setItem(k, v);
+        for (const [k, v] of Object.entries(saved.session || {})) sessionStorage.setItem(k, v);
+        // Markers of earlier applies of this snapshot are stale now
+        for (const k of Object.keys(sessionStorage)) {
+            if (k.startsWith(markerPrefix)) sessionStorage.removeItem(k);
+        }
+        sessionStorage.setItem(marker, '1');
+    } catch (e) {}
+})(%s, %s, %s, %f);
+"""
+
+# sessionStorage key recording that an apply of a snapshot was already restored in this tab:
+# MARKER_PREFIX + snapshot name + ":" + apply time, so a later apply (e.g. the next lease) restores again
+MARKER_PREFIX = "__crawlgridSession:"
+
+# Network.setCookies takes a narrower shape than Network.getCookies returns
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires",
+                 "priority", "sameParty", "sourceScheme", "sourcePort", "partitionKey")
+
+
+def _cookie_param(cookie: dict, expires_at: float) -> dict:
+    param = {k: cookie[k] for k in COOKIE_FIELDS if k in cookie}
+    # Injected cookies die with the snapshot; session cookies come back with expires -1
+    if param.get("expires", -1) <= 0 or cookie.get("session"):
+        param["expires"] = expires_at
+    else:
+        param["expires"] = min(param["expires"], expires_at)
+    return param
+
+
+def _cookie_key(cookie: dict) -> tuple:
+    """What identifies a cookie in the jar (and what Network.deleteCookies matches on)."""
+    return cookie["name"], cookie.get("domain", ""), cookie.get("path", "/")
+
+
+class SessionStore:
+    """
+    Named snapshots of logged-in state (cookies + local/session storage), kept in memory.
+    Each snapshot expires after its ttl; applying an expired one fails instead of
+    quietly injecting a dead session.
+    """
+    def __init__(self, default_ttl: float = 3600.0):
+        self.default_ttl = default_ttl
+        self.snapshots = {}
+
+    def put(self, name: str, state: dict, ttl: Optional[float] = None) -> dict:
+        now = time.time()
+        snapshot = {
+            "name": name,
+            "cookies": state.get("cookies", []),
+            "origins": state.get("origins", {}),
+            "created_at": now,
+            "expires_at": now + (ttl or self.default_ttl)
+        }
+        self.snapshots[name] = snapshot
+        return self.describe(snapshot)
+
+    def get(self, name: str) -> Optional[dict]:
+        snapshot = self.snapshots.get(name)
+        if snapshot is not None and snapshot["expires_at"] < time.time():
+            del self.snapshots[name]
+            return None
+        return snapshot
+
+    def delete(self, name: str) -> bool:
+        return self.snapshots.pop(name, None) is not None
+
+    def purge_expired(self):
+        now = time.time()
+        for name in [n for n, s in self.snapshots.items() if s["expires_at"] < now]:
+            del self.snapshots[name]
+
+    @staticmethod
+    def describe(snapshot: dict) -> dict:
+        """Metadata only: cookie values and storage contents are credentials."""
+        return {
+            "name": snapshot["name"],
+            "cookies": len(snapshot["cookies"]),
+            "cookie_domains": sorted({c.get("domain", "") for c in snapshot["cookies"]}),
+            "origins": sorted(snapshot["origins"]),
+            "created_at": snapshot["created_at"],
+            "expires_at": snapshot["expires_at"],
+            "expires_in": round(snapshot["expires_at"] - time.time(), 1)
+        }
+
+    def list(self) -> list:
+        self.purge_expired()
+        return [self.describe(s) for s in self.snapshots.values()]
+
+
+def capture_session(tab_obj, all_cookies: bool = False) -> dict:
+    """
+    Blocking: reads the tab's cookies and the current origin's storage.
+    all_cookies takes the whole browser's jar (needed when login spans several domains).
+    """
+    if all_cookies:
+        cookies = tab_obj.run_cdp("Network.getAllCookies").get("cookies", [])
+    else:
+        cookies = tab_obj.run_cdp("Network.getCookies").get("cookies", [])
+    storage = json.loads(tab_obj.run_js(CAPTURE_STORAGE_JS))
+    origins = {}
+    if storage["origin"] and storage["origin"] != "null":
+        session = {k: v for k, v in storage["session"].items() if not k.startswith(MARKER_PREFIX)}
+        origins[storage["origin"]] = {"local": storage["local"], "session": session}
+    return {"cookies": cookies, "origins": origins}
+
+
+def apply_session(tab_obj, snapshot: dict) -> dict:
+    """
+    Blocking: injects a snapshot into a tab ahead of its next navigation.
+    Cookies go into the browser's jar (shared by every tab of that browser) and
+    expire with the snapshot; storage is restored by a new-document script.
+    Returns what was injected ({"script_id", "cookies"}) for remove_session.
+    """
+    if snapshot["cookies"]:
+        tab_obj.run_cdp("Network.setCookies",
+                        cookies=[_cookie_param(c, snapshot["expires_at"]) for c in snapshot["cookies"]])
+    applied = {"script_id": None, "cookies": [_cookie_key(c) for c in snapshot["cookies"]]}
+    if snapshot["origins"]:
+        marker_prefix = f"{MARKER_PREFIX}{snapshot['name']}:"
+        script = RESTORE_STORAGE_JS % (json.dumps(snapshot["origins"]), json.dumps(f"{marker_prefix}{time.time()}"),
+                                       json.dumps(marker_prefix), snapshot["expires_at"])
+        applied["script_id"] = tab_obj.run_cdp("Page.addScriptToEvaluateOnNewDocument", source=script).get("identifier")
+    return applied
+
+
+def remove_session(tab_obj, script_ids: list, cookies: list):
+    """Blocking: takes injected state back out of a tab (restore scripts) and its browser's jar (cookies)."""
+    for script_id in script_ids:
+        tab_obj.run_cdp("Page.removeScriptToEvaluateOnNewDocument", identifier=script_id)
+    for name, domain, path in cookies:
+        tab_obj.run_cdp("Network.deleteCookies", name=name, domain=domain, path=path)
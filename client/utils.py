@@ -1,8 +1,12 @@
 import os
 import json
+import socket
+import shutil
 import psutil
+from typing import Optional
 
-REGISTRY_FILE = "browser_registry.json"
+# Each worker process of a cluster (see cluster.py) keeps its own registry file
+REGISTRY_FILE = os.environ.get("CRAWLGRID_REGISTRY", "browser_registry.json")
 
 def load_registry() -> dict:
     """Read the registry from disk."""
@@ -33,6 +37,22 @@ def update_registry(port: str, tab_id: str, status: str, url: str):
         print(f"⚠️ Registry Sync Warning: {e}")
 
 
+def add_registry_tab(port: str, tab_id: str, status: str = "idle", url: str = "about:blank"):
+    """Register a newly opened tab under its browser."""
+    registry = load_registry()
+    if port in registry:
+        registry[port].setdefault("tabs", {})[tab_id] = {"status": status, "url": url}
+        save_registry(registry)
+
+
+def remove_registry_tab(port: str, tab_id: str):
+    """Drop a closed tab from its browser's registry entry."""
+    registry = load_registry()
+    if port in registry and tab_id in registry[port].get("tabs", {}):
+        del registry[port]["tabs"][tab_id]
+        save_registry(registry)
+
+
 def get_active_ports():
     registry = load_registry()
     # Returns a list of keys (ports) as integers
@@ -57,9 +77,38 @@ def kill_process_tree(pid: int):
     except psutil.NoSuchProcess:
         return False
 
+def process_tree_rss(pid: int) -> int:
+    """Resident memory (bytes) of a process plus all of its children."""
+    try:
+        parent = psutil.Process(pid)
+        procs = [parent] + parent.children(recursive=True)
+    except (psutil.NoSuchProcess, psutil.AccessDenied, TypeError):
+        return 0
+
+    total = 0
+    for proc in procs:
+        try:
+            total += proc.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total
+
+def find_free_port() -> int:
+    """Ask the OS for a currently unused local port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def remove_user_data_dir(path: Optional[str]):
+    """Deletes a per-browser profile dir; anything not created by a launch profile is left alone."""
+    if path and os.path.basename(path).startswith("crawlgrid-"):
+        shutil.rmtree(path, ignore_errors=True)
+
 def cleanup_all_resources():
         """Kills all processes listed in the registry."""
         registry = load_registry()
         for port, data in registry.items():
             kill_process_tree(data["process_id"])
+            # Per-browser profile copies made by lean launch profiles
+            remove_user_data_dir(data.get("user_data_dir"))
         save_registry({})
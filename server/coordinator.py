@@ -0,0 +1,358 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Optional, List
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+HEARTBEAT_TIMEOUT = 15      # seconds without a heartbeat before a node is taken out of rotation
+MAX_ATTEMPTS = 3            # per work item, each on a different node when possible
+MAX_FINISHED_TASKS = 10000  # finished results kept for polling (oldest dropped first)
+# Full /get-url results (HTML included) are spooled here; only a summary stays in memory
+RESULTS_DIR = os.environ.get("CRAWLGRID_RESULTS_DIR", "coordinator_results")
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Same classes as the nodes' tab scheduler; lower value is dispatched first
+PRIORITY_CLASSES = {"interactive": 0, "default": 1, "bulk": 2}
+
+
+class Node:
+    def __init__(self, url: str, capacity: int = 0):
+        self.url = url.rstrip("/")
+        self.capacity = capacity    # tabs the node reported
+        self.idle = capacity        # idle tabs the node reported
+        self.inflight = 0           # requests we have outstanding on it
+        self.last_heartbeat = time.time()
+        self.failures = 0
+        self.completed = 0
+
+    @property
+    def alive(self) -> bool:
+        return time.time() - self.last_heartbeat < HEARTBEAT_TIMEOUT
+
+    @property
+    def free_slots(self) -> int:
+        return self.capacity - self.inflight if self.alive else 0
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "alive": self.alive,
+            "capacity": self.capacity,
+            "idle": self.idle,
+            "inflight": self.inflight,
+            "completed": self.completed,
+            "failures": self.failures,
+            "last_heartbeat": round(time.time() - self.last_heartbeat, 1)
+        }
+
+
+class WorkItem:
+    def __init__(self, url: str, priority: str = "default", tenant: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.priority = priority
+        self.tenant = tenant
+        self.status = "queued"
+        self.attempts = 0
+        self.tried_nodes = []
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def result_path(self) -> str:
+        return os.path.join(RESULTS_DIR, f"{self.id}.json.gz")
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "attempts": self.attempts,
+            "nodes": self.tried_nodes,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class SubmitRequest(BaseModel):
+    urls: List[str]
+    priority: str = "default"
+    tenant: Optional[str] = None
+
+
+class Coordinator:
+    """
+    Pools many nodes behind one global work queue.
+    Nodes register and heartbeat their tab capacity; queued work is dispatched to
+    whichever alive node has a free tab, and retried on another node if the first fails.
+    """
+    def __init__(self):
+        self.nodes = {}
+        # (priority rank, submission order, item): FIFO within a class
+        self.queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self.tasks = {}
+        self.finished = OrderedDict()
+        self.slot_freed = asyncio.Event()
+        self.client = None
+
+    # --- NODES ---
+
+    def heartbeat(self, url: str, capacity: int, idle: Optional[int] = None) -> Node:
+        url = url.rstrip("/")
+        node = self.nodes.get(url)
+        if node is None:
+            node = self.nodes[url] = Node(url, capacity)
+            print(f"🛰️ [Coordinator] Node registered: {url} ({capacity} tabs)")
+        node.capacity = capacity
+        node.idle = capacity if idle is None else idle
+        node.last_heartbeat = time.time()
+        self.slot_freed.set()
+        return node
+
+    def pick_node(self, exclude: List[str]) -> Optional[Node]:
+        candidates = [n for n in self.nodes.values() if n.free_slots > 0]
+        fresh = [n for n in candidates if n.url not in exclude]
+        # Prefer a node this item has not failed on; fall back to any node with room
+        pool = fresh or candidates
+        return max(pool, key=lambda n: n.free_slots) if pool else None
+
+    # --- WORK QUEUE ---
+
+    async def submit(self, request: SubmitRequest) -> List[str]:
+        if request.priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{request.priority}'. Use one of {list(PRIORITY_CLASSES)}.")
+        ids = []
+        for url in request.urls:
+            item = WorkItem(url, request.priority, request.tenant)
+            self.tasks[item.id] = item
+            await self._enqueue(item)
+            ids.append(item.id)
+        return ids
+
+    async def _enqueue(self, item: WorkItem):
+        await self.queue.put((PRIORITY_CLASSES[item.priority], next(self._seq), item))
+
+    def _finish(self, item: WorkItem, status: str):
+        item.status = status
+        item.finished_at = time.time()
+        self.finished[item.id] = True
+        while len(self.finished) > MAX_FINISHED_TASKS:
+            old_id, _ = self.finished.popitem(last=False)
+            old = self.tasks.pop(old_id, None)
+            if old is not None and os.path.exists(old.result_path):
+                os.remove(old.result_path)
+
+    @staticmethod
+    def _spool_result(item: WorkItem, result: dict) -> dict:
+        """Writes the full result to disk and returns the summary kept in memory."""
+        with gzip.open(item.result_path, "wt", encoding="utf-8") as f:
+            json.dump(result, f)
+        return {
+            "status": result.get("status"),
+            "port": result.get("port"),
+            "tab_id": result.get("tab_id"),
+            "html_bytes": len(result.get("html") or ""),
+            "stored": True
+        }
+
+    @staticmethod
+    def load_result(item: WorkItem) -> Optional[dict]:
+        if not os.path.exists(item.result_path):
+            return None
+        with gzip.open(item.result_path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def dispatch_loop(self):
+        """Pulls work off the global queue as soon as some node has a free tab."""
+        while True:
+            # Wait for room first, so the item taken is the most urgent one at that moment
+            while self.pick_node([]) is None:
+                self.slot_freed.clear()
+                await self.slot_freed.wait()
+            entry = await self.queue.get()
+            item = entry[2]
+            node = self.pick_node(item.tried_nodes)
+            if node is None:
+                # The node went away while we waited for work: keep the item's place in line
+                await self.queue.put(entry)
+                continue
+
+            node.inflight += 1
+            item.status = "running"
+            asyncio.create_task(self._run(item, node))
+
+    async def _run(self, item: WorkItem, node: Node):
+        item.attempts += 1
+        item.tried_nodes.append(node.url)
+        params = {"url": item.url, "priority": item.priority}
+        if item.tenant:
+            params["tenant"] = item.tenant
+
+        retry = False
+        try:
+            resp = await self.client.post(f"{node.url}/get-url", params=params)
+            if resp.status_code == 200:
+                item.result = await asyncio.to_thread(self._spool_result, item, resp.json())
+                node.completed += 1
+                self._finish(item, "done")
+            else:
+                item.error = f"{resp.status_code}: {resp.text[:500]}"
+                retry = resp.status_code in RETRYABLE_STATUS
+                if retry:
+                    node.failures += 1
+                else:
+                    self._finish(item, "failed")
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: the node answered 200 with a body that isn't JSON
+            item.error = f"{type(e).__name__}: {e}"
+            node.failures += 1
+            retry = True
+        except OSError as e:
+            # Spooling the result failed here; another node would not change that
+            item.error = f"Result could not be stored: {e}"
+            self._finish(item, "failed")
+        finally:
+            node.inflight -= 1
+            self.slot_freed.set()
+
+        if retry:
+            if item.attempts < MAX_ATTEMPTS:
+                print(f"🔁 [Coordinator] Retrying {item.url} (attempt {item.attempts + 1}), {node.url} failed")
+                item.status = "queued"
+                await self._enqueue(item)
+            else:
+                self._finish(item, "failed")
+
+    # --- GRID-WIDE FAN-OUT ---
+
+    async def fan_out(self, path: str, params: Optional[dict] = None, method: str = "GET") -> dict:
+        async def call(node: Node):
+            try:
+                resp = await self.client.request(method, f"{node.url}/{path}", params=params, timeout=120.0)
+                return node.url, resp.json()
+            except (httpx.HTTPError, ValueError) as e:
+                return node.url, {"status": "error", "message": str(e)}
+
+        nodes = [n for n in self.nodes.values() if n.alive]
+        return dict(await asyncio.gather(*(call(n) for n in nodes)))
+
+    async def launch(self, instances: int, base_port: int = 9222) -> dict:
+        async def launch_port(node: Node, port: int):
+            try:
+                resp = await self.client.get(f"{node.url}/launch", params={"port": port}, timeout=120.0)
+                return resp.status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        nodes = [n for n in self.nodes.values() if n.alive]
+        calls = [(n, p) for n in nodes for p in range(base_port, base_port + instances)]
+        results = await asyncio.gather(*(launch_port(n, p) for n, p in calls))
+        report = {}
+        for (node, port), ok in zip(calls, results):
+            report.setdefault(node.url, []).append({"port": port, "launched": ok})
+        return report
+
+    async def close(self) -> dict:
+        async def close_node(node: Node):
+            try:
+                ports = (await self.client.get(f"{node.url}/list-browsers")).json()
+                await asyncio.gather(*(self.client.get(f"{node.url}/kill", params={"port": p}) for p in ports))
+                return node.url, ports
+            except (httpx.HTTPError, ValueError) as e:
+                return node.url, {"status": "error", "message": str(e)}
+
+        nodes = [n for n in self.nodes.values() if n.alive]
+        return dict(await asyncio.gather(*(close_node(n) for n in nodes)))
+
+
+coordinator = Coordinator()
+app = FastAPI()
+
+@app.on_event("startup")
+async def startup_event():
+    coordinator.client = httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=None))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    asyncio.create_task(coordinator.dispatch_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await coordinator.client.aclose()
+
+# NODE MEMBERSHIP
+
+@app.post('/register')
+async def register_node(url: str, capacity: int = 0):
+    return {"status": "success", "node": coordinator.heartbeat(url, capacity).to_dict()}
+
+@app.post('/heartbeat')
+async def heartbeat(url: str, capacity: int, idle: Optional[int] = None):
+    return {"status": "success", "node": coordinator.heartbeat(url, capacity, idle).to_dict()}
+
+@app.post('/deregister')
+async def deregister_node(url: str):
+    if coordinator.nodes.pop(url.rstrip("/"), None) is None:
+        raise HTTPException(status_code=404, detail=f"Node {url} not registered.")
+    return {"status": "success", "message": f"Node {url} removed."}
+
+@app.get('/nodes')
+async def list_nodes():
+    return [n.to_dict() for n in coordinator.nodes.values()]
+
+# WORK QUEUE
+
+@app.post('/submit')
+async def submit(request: SubmitRequest):
+    try:
+        ids = await coordinator.submit(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "task_ids": ids, "queued": coordinator.queue.qsize()}
+
+@app.get('/task')
+async def get_task(task_id: str, full: bool = False):
+    """Task status with a result summary; full=true adds the node's complete response (HTML included)."""
+    item = coordinator.tasks.get(task_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail=f"Task {task_id} not found.")
+    task = item.to_dict()
+    if full and item.status == "done":
+        task["result"] = await asyncio.to_thread(coordinator.load_result, item)
+    return task
+
+# GRID-WIDE OPERATIONS
+
+@app.get('/grid/launch')
+async def grid_launch(instances: int = 1, base_port: int = 9222):
+    return await coordinator.launch(instances, base_port)
+
+@app.get('/grid/launch-tabs')
+async def grid_launch_tabs(total_tabs: Optional[int] = None, tab_per_browser: Optional[int] = None):
+    params = {"total_tabs": total_tabs} if total_tabs else {"tab_per_browser": tab_per_browser}
+    return await coordinator.fan_out("launch-tabs", params)
+
+@app.get('/grid/close')
+async def grid_close():
+    return await coordinator.close()
+
+@app.get('/grid/status')
+async def grid_status():
+    statuses = await coordinator.fan_out("status")
+    return {
+        "nodes": statuses,
+        "queued": coordinator.queue.qsize(),
+        "running": sum(n.inflight for n in coordinator.nodes.values()),
+        "capacity": sum(n.capacity for n in coordinator.nodes.values() if n.alive)
+    }
+
+if __name__ == '__main__':
+    uvicorn.run("coordinator:app", host='0.0.0.0', port=7000)
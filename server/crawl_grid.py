@@ -1,28 +1,111 @@
+import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional decoders: the SDK only advertises formats it can read back
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def accept_headers() -> dict:
+    """Best response format this client can decode: msgpack and zstd when installed."""
+    encodings = (["zstd"] if zstandard is not None else []) + ["gzip"]
+    media = "application/msgpack, application/json;q=0.9" if msgpack is not None else "application/json"
+    return {"Accept": media, "Accept-Encoding": ", ".join(encodings)}
+
+def decode_response(response: requests.Response):
+    """Undoes whatever encoding the node negotiated and returns the payload."""
+    body = response.content
+    # urllib3 already strips gzip (and zstd on recent versions); handle zstd ourselves otherwise
+    if response.headers.get("Content-Encoding") == "zstd" and body[:4] == ZSTD_MAGIC:
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    if "msgpack" in response.headers.get("Content-Type", ""):
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body) if orjson is not None else json.loads(body)
 
 class CrawlGrid:
-    def __init__(self, remote_urls: list[str]):
-        self.remote_urls = remote_urls
+    """
+    Talks to every node directly. Grid-wide calls fan out concurrently.
+    For large grids, run server/coordinator.py and point the nodes at it
+    (CRAWLGRID_COORDINATOR) instead of driving each node from here.
+    """
+    def __init__(self, remote_urls: list[str], max_workers: int = 32):
+        self.remote_urls = [url.rstrip("/") for url in remote_urls]
         self.ports = []
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _fan_out(self, fn, calls: list) -> list:
+        """Runs fn(*args) for every args tuple concurrently, preserving order."""
+        return list(self.executor.map(lambda args: fn(*args), calls))
+
+    def _launch(self, remote_url: str, port: int):
+        try:
+            response = self.session.get(f"{remote_url}/launch", params={"port": port}, timeout=120)
+            if response.status_code == 200:
+                print(f"Browser launched on {remote_url} port {port}")
+                return port
+            print(f"Failed to launch browser on {remote_url} port {port}: {response.text}")
+        except Exception as e:
+            print(f"Failed to launch browser on {remote_url}: {e}")
+        return None
 
     def launch_grid(self, instances: int=1):
-        for remote_url in self.remote_urls:
-            for port in range(9222, 9222 + instances):
-                try:
-                    response = requests.get(f"{remote_url}/launch/{port}", )
-                    if response.status_code == 200:
-                        self.ports.append(port)
-                        print(f"Browser launched on {remote_url}")
-                except Exception as e:
-                    print(f"Failed to launch browser on {remote_url}: {e}")
+        calls = [(url, port) for url in self.remote_urls for port in range(9222, 9222 + instances)]
+        launched = self._fan_out(self._launch, calls)
+        self.ports.extend(port for port in launched if port is not None)
+
+    def _close(self, remote_url: str):
+        try:
+            ports = self.session.get(f"{remote_url}/list-browsers", timeout=30).json()
+            for port, response in zip(ports, self._fan_out(
+                lambda p: self.session.get(f"{remote_url}/kill", params={"port": p}, timeout=30),
+                [(p,) for p in ports]
+            )):
+                if response.status_code == 200:
+                    print(f"Browser closed on {remote_url} port {port}")
+        except Exception as e:
+            print(f"Failed to close browser on {remote_url}: {e}")
 
     def close_grid(self):
-        for remote_url in self.remote_urls:
+        # Each node closes its own browsers concurrently; nodes run on their own threads
+        with ThreadPoolExecutor(max_workers=max(1, len(self.remote_urls))) as pool:
+            list(pool.map(self._close, self.remote_urls))
+        self.ports = []
+
+    def get_url(self, url: str, remote_url: str = None, release_tab: bool = True, **params) -> dict:
+        """Fetches a page through a node; the response format is negotiated and decoded transparently."""
+        target = (remote_url or self.remote_urls[0]).rstrip("/")
+        response = self.session.post(
+            f"{target}/get-url",
+            params={"url": url, "release_tab": release_tab, **params},
+            headers=accept_headers(),
+            timeout=120
+        )
+        if response.status_code != 200:
+            raise Exception(f"get-url failed on {target}: {response.status_code} {response.text[:500]}")
+        return decode_response(response)
+
+    def release_tab(self, tab_id: str, remote_url: str = None) -> dict:
+        target = (remote_url or self.remote_urls[0]).rstrip("/")
+        return self.session.post(f"{target}/release-tab", params={"tab_id": tab_id}, timeout=30).json()
+
+    def status(self) -> dict:
+        def fetch(remote_url: str):
             try:
-                ports = requests.get(f"{remote_url}/list-browsers").json()
-                for port in ports:
-                    response = requests.get(f"{remote_url}/kill/{port}", )
-                    if response.status_code == 200:
-                        print(f"Browser closed on {remote_url} port {port}")
+                return self.session.get(f"{remote_url}/status", timeout=10).json()
             except Exception as e:
-                print(f"Failed to close browser on {remote_url}: {e}")
+                return {"status": "error", "message": str(e)}
+
+        return dict(zip(self.remote_urls, self._fan_out(fetch, [(u,) for u in self.remote_urls])))
@@ -3,9 +3,47 @@ import httpx
 import time
 import json
 import random
+from collections import deque
 from contextlib import asynccontextmanager
 from typing import List, Optional, Dict
 
+class RetryableError(Exception):
+    """A failure worth trying again on another node (429, 5xx, connection problems)."""
+
+class NodeLatency:
+    """Recent successful /get-url latencies of one node."""
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class RequestPolicy:
+    """
+    How get_session acquires a tab:
+      - up to max_attempts tries, each on a node not tried before, for retryable failures
+      - once a node has min_samples latencies, a request still running past its
+        hedge_percentile latency is duplicated on another node; the first answer wins
+    """
+    def __init__(self, max_attempts: int = 3, retry_statuses=(429, 500, 502, 503, 504), backoff: float = 0.2,
+                 hedge: bool = True, hedge_percentile: float = 0.95, min_samples: int = 20,
+                 min_hedge_delay: float = 0.5, request_timeout: float = 60.0):
+        self.max_attempts = max_attempts
+        self.retry_statuses = set(retry_statuses)
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.request_timeout = request_timeout
+
 class BrowserSession:
     """
     A stateful session object that represents a locked tab.
@@ -53,8 +91,13 @@ class BrowserSession:
             self._listener_task.cancel()
 
 class CrawlGrid:
-    def __init__(self, remote_urls: List[str]):
+    def __init__(self, remote_urls: List[str], policy: Optional[RequestPolicy] = None):
         self.remote_urls = remote_urls
+        self.policy = policy or RequestPolicy()
+        self.latency = {url: NodeLatency() for url in remote_urls}
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "discarded_tabs": 0}
+        # Losing hedges still finish in the background so their tab can be released
+        self._background = set()
 
     # --- INFRASTRUCTURE & SCALING ---
 
@@ -85,31 +128,121 @@ class CrawlGrid:
 
     # --- LOAD BALANCING & SESSION LOGIC ---
 
-    async def _get_best_node(self) -> str:
-        """Finds the node with the most available (idle) tabs."""
-        best_url = self.remote_urls[0]
-        max_idle = -1
-        # async with httpx.AsyncClient() as client:
-        #     for url in self.remote_urls:
-        #         try:
-        #             resp = await client.get(f"{url}/status", timeout=2.0)
-        #             idle = resp.json().get("idle_tabs", 0)
-        #             if idle > max_idle:
-        #                 max_idle = idle
-        #                 best_url = url
-        #         except: continue
-        return best_url
+    def _pick_node(self, exclude: set) -> Optional[str]:
+        """Fastest node (by median latency) not tried yet; untried nodes first, ties broken randomly."""
+        candidates = [url for url in self.remote_urls if url not in exclude]
+        if not candidates:
+            return None
+        def key(url):
+            median = self.latency[url].percentile(0.5)
+            return (median if median is not None else 0.0, self.latency[url].failures, random.random())
+        return min(candidates, key=key)
+
+    def _hedge_delay(self, remote_url: str) -> Optional[float]:
+        tracker = self.latency[remote_url]
+        if not self.policy.hedge or len(tracker.samples) < self.policy.min_samples:
+            return None
+        return max(self.policy.min_hedge_delay, tracker.percentile(self.policy.hedge_percentile))
+
+    async def _request_tab(self, remote_url: str, url: str) -> dict:
+        started = time.perf_counter()
+        try:
+            # Own client: an abandoned hedge keeps running after the winner's caller has moved on
+            async with httpx.AsyncClient(timeout=self.policy.request_timeout) as client:
+                resp = await client.post(f"{remote_url}/get-url", params={"url": url, "release_tab": False})
+        except httpx.TransportError as e:
+            self.latency[remote_url].failures += 1
+            raise RetryableError(f"{remote_url}: {type(e).__name__} {e}")
+        if resp.status_code in self.policy.retry_statuses:
+            self.latency[remote_url].failures += 1
+            raise RetryableError(f"{remote_url}: HTTP {resp.status_code}")
+        if resp.status_code != 200:
+            raise Exception(f"Grid Capacity Full on {remote_url} {resp.text[:500]} {resp.status_code}")
+        self.latency[remote_url].record(time.perf_counter() - started)
+        return resp.json()
+
+    async def _discard(self, task: asyncio.Task, remote_url: str):
+        """Waits out a losing request and hands its tab straight back."""
+        try:
+            data = await task
+        except Exception:
+            return
+        if data.get("tab_id"):
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                await client.post(f"{remote_url}/release-tab", params={"tab_id": data["tab_id"]})
+            self.stats["discarded_tabs"] += 1
+
+    def _abandon(self, task: asyncio.Task, remote_url: str):
+        background = asyncio.create_task(self._discard(task, remote_url))
+        self._background.add(background)
+        background.add_done_callback(self._background.discard)
+
+    async def _hedged_request(self, primary: str, url: str, tried: set):
+        """One attempt: primary request, plus a hedge on another node if it runs past the threshold."""
+        first = asyncio.create_task(self._request_tab(primary, url))
+        nodes = {first: primary}
+        try:
+            delay = self._hedge_delay(primary)
+            if delay is not None:
+                await asyncio.wait({first}, timeout=delay)
+            secondary = None if delay is None or first.done() else self._pick_node(tried)
+            if secondary is None:
+                return primary, await asyncio.shield(first)
+
+            tried.add(secondary)
+            self.stats["hedges"] += 1
+            second = asyncio.create_task(self._request_tab(secondary, url))
+            nodes[second] = secondary
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        for loser in pending:
+                            self._abandon(loser, nodes[loser])
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return nodes[task], task.result()
+                    error = task.exception()
+            raise error
+        except asyncio.CancelledError:
+            # The caller gave up, but the nodes will still lease tabs: release them when they arrive
+            for task, node in nodes.items():
+                if not task.done() or (not task.cancelled() and task.exception() is None):
+                    self._abandon(task, node)
+            raise
+
+    async def _acquire_tab(self, url: str):
+        """Leases a tab for url somewhere on the grid, retrying and hedging per the policy."""
+        self.stats["requests"] += 1
+        tried = set()
+        last_error = None
+        for attempt in range(self.policy.max_attempts):
+            remote_url = await self._get_best_node(exclude=tried)
+            if remote_url is None:
+                break
+            tried.add(remote_url)
+            try:
+                return await self._hedged_request(remote_url, url, tried)
+            except RetryableError as e:
+                last_error = e
+                self.stats["retries"] += 1
+                # No backoff when there is nothing left to try
+                if attempt + 1 < self.policy.max_attempts and self._pick_node(tried) is not None:
+                    print(f"🔁 Attempt {attempt + 1} for {url} failed ({e}), trying another node")
+                    await asyncio.sleep(self.policy.backoff * (2 ** attempt))
+        raise Exception(f"No node could serve {url} after {len(tried)} node(s): {last_error}")
+
+    async def _get_best_node(self, exclude: Optional[set] = None) -> Optional[str]:
+        """Finds the fastest node (by tracked latency) that hasn't been tried for this request."""
+        return self._pick_node(exclude or set())
 
     @asynccontextmanager
     async def get_session(self, url: str):
         """Context manager to handle tab acquisition and automatic release."""
-        remote_url = await self._get_best_node()
+        remote_url, data = await self._acquire_tab(url)
         async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(f"{remote_url}/get-url", params={"url": url, "release_tab": False})
-            if resp.status_code != 200:
-                raise Exception(f"Grid Capacity Full on {remote_url} {resp.json()} {resp.status_code}")
-            
-            data = resp.json()
             session = BrowserSession(self, remote_url, data['tab_id'], data['port'], url)
             try:
                 yield session